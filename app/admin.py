@@ -1,5 +1,12 @@
 from django.contrib import admin
-from .models import StudyCenter, CustomUser, Course, Certificate, CertificatesSet
+from .models import (
+    StudyCenter,
+    CustomUser,
+    Course,
+    Certificate,
+    CertificatesSet,
+    CertificateRenderJob,
+)
 from django.contrib.auth.admin import UserAdmin
 from django.utils.translation import gettext_lazy as _
 
@@ -46,3 +53,4 @@ admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Course)
 admin.site.register(Certificate)
 admin.site.register(CertificatesSet)
+admin.site.register(CertificateRenderJob)
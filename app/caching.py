@@ -0,0 +1,77 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache, caches
+
+
+# certificate_by_uuid responses live in the "responses" cache, which other
+# processes (web workers, run_render_jobs) can share and invalidate
+def certificate_lookup_key(uuid):
+    return f"certificate-lookup:{uuid}"
+
+
+def get_certificate_lookup(uuid):
+    return caches["responses"].get(certificate_lookup_key(uuid))
+
+
+def set_certificate_lookup(uuid, data):
+    caches["responses"].set(
+        certificate_lookup_key(uuid),
+        data,
+        settings.CERTIFICATE_LOOKUP_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_certificate_lookups(uuids):
+    caches["responses"].delete_many(
+        [certificate_lookup_key(uuid) for uuid in uuids]
+    )
+
+
+def user_key(user_id):
+    return f"auth-user:{user_id}"
+
+
+def get_cached_user(user_id):
+    return cache.get(user_key(user_id))
+
+
+def set_cached_user(user_id, user):
+    cache.set(user_key(user_id), user, settings.AUTH_USER_CACHE_TIMEOUT)
+
+
+def invalidate_cached_users(user_ids):
+    cache.delete_many([user_key(user_id) for user_id in user_ids if user_id])
+
+
+def response_version_key(model):
+    return f"response-version:{model._meta.label_lower}"
+
+
+def get_response_version(models):
+    """
+    Combined version of the models a cached response depends on.
+    """
+    response_cache = caches["responses"]
+    keys = [response_version_key(model) for model in models]
+    versions = response_cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock so a lost counter never reuses old values
+            response_cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = response_cache.get(key)
+    return "-".join(str(versions[key]) for key in keys)
+
+
+def bump_response_version(model):
+    response_cache = caches["responses"]
+    key = response_version_key(model)
+    try:
+        response_cache.incr(key)
+    except ValueError:
+        response_cache.add(key, time.time_ns(), timeout=None)
+
+
+def response_key(view_name, version, scope, url):
+    digest = hashlib.sha256(f"{scope}:{url}".encode()).hexdigest()
+    return f"response:{view_name}:{version}:{digest}"
@@ -1,34 +1,222 @@
 import os
 import io
+import functools
+import itertools
+import multiprocessing
+import threading
 import zipfile
+import django
 import qrcode
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
 from PIL import Image, ImageDraw, ImageFont
+from .instrumentation import timed
 
 base_dir = os.getcwd()
 
 
+class LRUCache:
+    """
+    Small thread-safe, size-bounded mapping for the in-process render caches.
+    With weigh, maxsize bounds the summed weight of the values instead of
+    their number; the newest entry is kept even if it alone is heavier.
+    """
+
+    def __init__(self, maxsize, weigh=None):
+        self.maxsize = maxsize
+        self.weigh = weigh
+        self._data = OrderedDict()
+        self._weights = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        weight = self.weigh(value) if self.weigh else 1
+        with self._lock:
+            self._total += weight - self._weights.get(key, 0)
+            self._data[key] = value
+            self._weights[key] = weight
+            self._data.move_to_end(key)
+            while self._total > self.maxsize and len(self._data) > 1:
+                self._remove(next(iter(self._data)))
+
+    def discard_if(self, predicate):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weights.clear()
+            self._total = 0
+
+    def _remove(self, key):
+        del self._data[key]
+        self._total -= self._weights.pop(key)
+
+
+class RenderTemplate:
+    """
+    A course background decoded once, plus the validated text slots
+    ((x, y, font) or None for incomplete coordinates) and QR code position.
+    """
+
+    def __init__(self, image, text_slots, qrcode_slot):
+        self.image = image
+        self.text_slots = text_slots
+        self.qrcode_slot = qrcode_slot
+
+
+DEFAULT_FONT = "Montserrat-Medium.ttf"
+
+
+def _decoded_size(template):
+    image = template.image
+    return image.width * image.height * len(image.getbands())
+
+
+_templates = LRUCache(
+    getattr(settings, "CERTIFICATE_TEMPLATE_CACHE_BYTES", 128 * 1024 * 1024),
+    weigh=_decoded_size,
+)
+_fonts = LRUCache(getattr(settings, "CERTIFICATE_FONT_CACHE_SIZE", 32))
+_font_files = LRUCache(getattr(settings, "CERTIFICATE_FONT_CACHE_SIZE", 32))
+_qrcodes = LRUCache(getattr(settings, "CERTIFICATE_QRCODE_CACHE_SIZE", 512))
+
+# Image encoder and archive defaults per output format. Images are already
+# compressed, so archives are STORED unless DEFLATE is asked for. PNG level 1
+# encodes A4 backgrounds 1.4-5x faster than zlib's default 6 for files about
+# 20% larger, and encoding dominates archive render time.
+OUTPUT_FORMATS = {
+    "png": {
+        "extension": "png",
+        "quality": None,
+        "compress_level": 1,
+        "compression": "stored",
+    },
+    "jpeg": {
+        "extension": "jpg",
+        "quality": 85,
+        "compress_level": None,
+        "compression": "stored",
+    },
+    "webp": {
+        "extension": "webp",
+        "quality": 80,
+        "compress_level": None,
+        "compression": "stored",
+    },
+    "pdf": {
+        "extension": "pdf",
+        "quality": 85,
+        "compress_level": None,
+        "compression": None,
+    },
+}
+
+# Resolution used to size PDF pages from certificate pixels
+PDF_DPI = 300
+
+# Maps QR matrix booleans (0/1 bytes) to alpha values
+_QR_MODULE_ALPHA = bytes([0, 255]) + bytes(254)
+
+# Render processes start from a clean interpreter, never a fork of a web
+# worker that may hold locks in other threads
+RENDER_POOL_START_METHOD = (
+    "forkserver"
+    if "forkserver" in multiprocessing.get_all_start_methods()
+    else "spawn"
+)
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """
+    The process pool shared by every archive rendered in this process. Its
+    workers live as long as the pool, so their template, font and QR code
+    caches stay warm from one archive to the next.
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(
+                max_workers=settings.CERTIFICATE_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context(RENDER_POOL_START_METHOD),
+                initializer=django.setup,
+            )
+        return _render_pool
+
+
+def shutdown_render_pool(pool=None):
+    """
+    Shut the shared pool down (only if it is still pool, when given); the
+    next archive starts a new one.
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None or (pool is not None and _render_pool is not pool):
+            return
+        pool, _render_pool = _render_pool, None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
 class Certificates:
 
     # Generate QR code
     @staticmethod
     def generate_qrcode(url, size=100):
+        """
+        Return a size x size RGBA QR code: black modules on a transparent
+        background. Results are memoized per (url, size) and must be treated
+        as read-only.
+        """
+        key = (url, size)
+        img = _qrcodes.get(key)
+        if img is None:
+            img = Certificates._render_qrcode(url, size)
+            _qrcodes.set(key, img)
+        return img
+
+    @staticmethod
+    def _render_qrcode(url, size):
         qr = qrcode.QRCode(
             version=1,
             error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
             border=4,
         )
         qr.add_data(url)
         qr.make(fit=True)
 
-        img = qr.make_image(fill="black", back_color="white").convert("RGBA")
-        datas = img.getdata()
-        new_data = [
-            (255, 255, 255, 0) if item[:3] == (255, 255, 255) else item
-            for item in datas
-        ]
-        img.putdata(new_data)
-        img = img.resize((size, size), Image.LANCZOS)
+        # One byte per module (border included): 255 for dark, 0 for light
+        matrix = qr.get_matrix()
+        count = len(matrix)
+        mask = Image.frombytes(
+            "L",
+            (count, count),
+            b"".join(bytes(row) for row in matrix).translate(_QR_MODULE_ALPHA),
+        )
+
+        # Scale whole modules up to at least the target, then smooth down
+        box_size = -(-size // count)
+        mask = mask.resize((count * box_size, count * box_size), Image.NEAREST)
+        if mask.size != (size, size):
+            mask = mask.resize((size, size), Image.LANCZOS)
+
+        img = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        img.putalpha(mask)
         return img
 
     @staticmethod
@@ -42,81 +230,427 @@ class Certificates:
         return text_width, text_height
 
     @staticmethod
-    def generate_one_certificate(certificate):
+    def get_template(certificate):
+        """
+        Return the compiled RenderTemplate for a certificate's background and
+        layout. Templates are keyed by image path, file mtime and layout, so a
+        replaced image or moved coordinates always compile a fresh one.
+        """
+        path = os.path.join(base_dir, certificate["bg_image_path"])
+        mtime = os.stat(path).st_mtime_ns
+        text_slots = tuple(
+            (text["x"], text["y"], text["size"], text.get("font", DEFAULT_FONT))
+            if all(k in text for k in ("x", "y", "size"))
+            else None
+            for text in certificate.get("texts", [])
+        )
+        qr_data = certificate.get("qrcode")
+        qrcode_slot = (
+            (qr_data.get("x", 0), qr_data.get("y", 0), qr_data.get("size", 100))
+            if qr_data and "url" in qr_data
+            else None
+        )
+        key = (path, mtime, text_slots, qrcode_slot)
+
+        template = _templates.get(key)
+        if template is None:
+            with Image.open(path) as img:
+                img.load()
+                template = RenderTemplate(
+                    img.copy(),
+                    tuple(
+                        (slot[0], slot[1], Certificates.get_font(slot[2], slot[3]))
+                        if slot
+                        else None
+                        for slot in text_slots
+                    ),
+                    qrcode_slot,
+                )
+            _templates.set(key, template)
+        return template
+
+    @staticmethod
+    def get_font(size, font_name=DEFAULT_FONT):
+        """
+        Return a shared FreeTypeFont for a file in static/fonts at a size.
+        Font files are read once; parsed fonts are kept in a bounded LRU.
+        """
+        key = (font_name, size)
+        font = _fonts.get(key)
+        if font is None:
+            font_bytes = _font_files.get(font_name)
+            if font_bytes is None:
+                # basename() keeps payload-supplied names inside static/fonts
+                font_path = os.path.join(
+                    base_dir, "static", "fonts", os.path.basename(font_name)
+                )
+                with open(font_path, "rb") as f:
+                    font_bytes = f.read()
+                _font_files.set(font_name, font_bytes)
+            font = ImageFont.truetype(io.BytesIO(font_bytes), size=size)
+            _fonts.set(key, font)
+        return font
+
+    @staticmethod
+    def invalidate_templates(bg_image_path):
+        path = os.path.join(base_dir, bg_image_path)
+        _templates.discard_if(lambda key: key[0] == path)
+
+    @staticmethod
+    @timed("render")
+    def generate_one_certificate(certificate, options=None):
         if not certificate.get("bg_image_path") or not certificate.get("name"):
             return None  # Skip if required data is missing
 
         try:
-            img = Image.open(os.path.join(base_dir, certificate["bg_image_path"]))
+            template = Certificates.get_template(certificate)
         except FileNotFoundError:
             print(
                 f"Warning: Background image {certificate['bg_image_path']} not found. Skipping..."
             )
             return None
 
+        img = template.image.copy()
         draw = ImageDraw.Draw(img)
 
         # Draw Texts
-        for text in certificate.get("texts", []):
-            if not all(k in text for k in ("content", "x", "y", "size")):
+        for slot, text in zip(template.text_slots, certificate.get("texts", [])):
+            if slot is None or "content" not in text:
                 continue
 
-            font_path = os.path.join(
-                base_dir, "static", "fonts", "Montserrat-Medium.ttf"
+            x, y, font = slot
+            text_width, text_height = Certificates.get_text_dimensions(
+                text["content"], font
+            )
+            draw.text(
+                xy=(x, y - (text_height // 5.5)),
+                text=text["content"],
+                fill=(15, 15, 15),
+                font=font,
+                stroke_width=1.5,
+                stroke_fill=(15, 15, 15),
             )
-            with open(font_path, "rb") as f:
-                font_buffer = io.BytesIO(f.read())
-                font_buffer.seek(0)
-                font = ImageFont.truetype(font_buffer, size=text["size"])
-                text_width, text_height = Certificates.get_text_dimensions(
-                    text["content"], font
-                )
-
-                x, y = text["x"], text["y"] - (text_height // 5.5)
-                draw.text(
-                    xy=(x, y),
-                    text=text["content"],
-                    fill=(15, 15, 15),
-                    font=font,
-                    stroke_width=1.5,
-                    stroke_fill=(15, 15, 15),
-                )
 
         # Add QR Code (if present)
-        if "qrcode" in certificate and "url" in certificate["qrcode"]:
-            qr_data = certificate["qrcode"]
-            qr_size = qr_data.get("size", 100)  # Default size if missing
-            qrcode_img = Certificates.generate_qrcode(qr_data["url"], qr_size)
-
-            qr_x, qr_y = qr_data.get("x", 0), qr_data.get("y", 0)
+        if template.qrcode_slot:
+            qr_x, qr_y, qr_size = template.qrcode_slot
+            qrcode_img = Certificates.generate_qrcode(
+                certificate["qrcode"]["url"], qr_size
+            )
             img.paste(qrcode_img, (qr_x, qr_y), qrcode_img)
 
         # Save Image to Buffer
-        buffer = io.BytesIO()
-        img.convert("RGB").save(buffer, format="PNG")
         return {
             "name": certificate["name"],
-            "content": buffer.getvalue(),
+            "content": Certificates.encode_image(img.convert("RGB"), options),
+        }
+
+    @staticmethod
+    def get_output_options(
+        format="png", quality=None, compress_level=None, compression=None
+    ):
+        """
+        Fill in per-format defaults for the image encoder and archive.
+        PDF pages are embedded as JPEG, so they share the JPEG settings.
+        """
+        if format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format: {format}")
+
+        defaults = OUTPUT_FORMATS[format]
+        return {
+            "format": format,
+            "quality": quality if quality is not None else defaults["quality"],
+            "compress_level": (
+                compress_level
+                if compress_level is not None
+                else defaults["compress_level"]
+            ),
+            "compression": compression or defaults["compression"],
         }
 
     @staticmethod
-    def generate_many_certificates(data: dict):
+    def encode_image(img, options=None):
+        options = options or Certificates.get_output_options()
+        buffer = io.BytesIO()
+        if options["format"] == "png":
+            img.save(buffer, format="PNG", compress_level=options["compress_level"])
+        elif options["format"] == "webp":
+            img.save(buffer, format="WEBP", quality=options["quality"], method=4)
+        else:
+            img.save(
+                buffer, format="JPEG", quality=options["quality"], optimize=True
+            )
+        return buffer.getvalue()
+
+    @staticmethod
+    def generate_cached_certificate(certificate, cache, options=None):
+        """
+        generate_one_certificate backed by a RenderCache: unchanged
+        certificates are read from disk instead of being re-rendered.
+        """
+        key = cache.key_for(certificate, Certificates._encoder_options(options))
+        if key:
+            content = cache.get(key)
+            if content is not None:
+                return {"name": certificate["name"], "content": content}
+
+        image = Certificates.generate_one_certificate(certificate, options)
+        if image and key:
+            cache.set(key, image["content"])
+        return image
+
+    @staticmethod
+    def _encoder_options(options):
+        # Only the settings that change image bytes belong in a cache key
+        options = options or Certificates.get_output_options()
+        image_format = "jpeg" if options["format"] == "pdf" else options["format"]
+        if image_format == "png":
+            return {"format": "png", "compress_level": options["compress_level"]}
+        return {"format": image_format, "quality": options["quality"]}
+
+    @staticmethod
+    def render_certificates(
+        data: dict, progress_callback=None, workers=None, cache=None, options=None
+    ):
+        """
+        Yield rendered certificates in input order, skipping invalid entries.
+
+        With more than one worker the certificates are rendered in the shared
+        process pool; at most two tasks per worker are in flight at any time.
+        With a RenderCache only certificates whose inputs changed are rendered.
+        """
         if "certificates" not in data or not isinstance(data["certificates"], list):
             raise ValueError("Invalid data format: 'certificates' key must contain a list")
 
-        images = []
-        for certificate in data["certificates"]:
-            image = Certificates.generate_one_certificate(certificate)
+        if workers is None:
+            workers = getattr(settings, "CERTIFICATE_RENDER_WORKERS", 1)
+        workers = min(workers, len(data["certificates"]))
+
+        if cache:
+            render = functools.partial(
+                Certificates.generate_cached_certificate, cache=cache, options=options
+            )
+        else:
+            render = functools.partial(
+                Certificates.generate_one_certificate, options=options
+            )
+
+        if workers > 1:
+            images = Certificates._render_in_pool(
+                render, data["certificates"], workers
+            )
+        else:
+            images = map(render, data["certificates"])
+
+        for index, image in enumerate(images, start=1):
+            # Let callers (e.g. render jobs) report progress or abort
+            if progress_callback:
+                progress_callback(index)
             if image:
-                images.append(image)
+                yield image
+
+    @staticmethod
+    def _render_in_pool(render, certificates, workers):
+        certificates = iter(certificates)
+        pool = get_render_pool()
+        pending = deque()
+        try:
+            pending.extend(
+                pool.submit(render, certificate)
+                for certificate in itertools.islice(certificates, workers * 2)
+            )
+            while pending:
+                image = pending.popleft().result()
+                for certificate in itertools.islice(certificates, 1):
+                    pending.append(pool.submit(render, certificate))
+                yield image
+        except BrokenProcessPool:
+            # A render process died; start a fresh pool for the next archive
+            shutdown_render_pool(pool)
+            raise
+        finally:
+            # Runs on client disconnect too; drop work that hasn't started
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def stream_many_certificates(
+        data: dict, progress_callback=None, cache=None, options=None
+    ):
+        """
+        Return an iterator of archive chunks, one per rendered certificate:
+        a ZIP of images, or a single multi-page PDF for the "pdf" format.
 
-        if not images:
+        The first certificate is rendered eagerly so an empty set raises
+        ValueError before any bytes are sent to the client.
+        """
+        options = options or Certificates.get_output_options()
+        images = Certificates.render_certificates(
+            data, progress_callback, cache=cache, options=options
+        )
+        first_image = next(images, None)
+        if first_image is None:
             raise ValueError("No valid certificates were generated.")
+        images = itertools.chain([first_image], images)
+
+        if options["format"] == "pdf":
+            chunks = Certificates._pdf_chunks(images)
+        else:
+            chunks = Certificates._zip_chunks(images, options)
+
+        def finish():
+            yield from chunks
+            if cache:
+                cache.prune()
 
-        # Create an in-memory zip archive
-        mem_zip = io.BytesIO()
-        with zipfile.ZipFile(mem_zip, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        return finish()
+
+    @staticmethod
+    def _zip_chunks(images, options):
+        extension = OUTPUT_FORMATS[options["format"]]["extension"]
+        compression = (
+            zipfile.ZIP_DEFLATED
+            if options["compression"] == "deflated"
+            else zipfile.ZIP_STORED
+        )
+        stream = _ZipStream()
+        with zipfile.ZipFile(stream, "w", compression) as zip_file:
             for image in images:
-                zip_file.writestr(f"{image['name']}.png", image["content"])
-        mem_zip.seek(0)
-        return mem_zip.getvalue()
+                zip_file.writestr(f"{image['name']}.{extension}", image["content"])
+                yield stream.pop()
+        # Central directory
+        yield stream.pop()
+
+    @staticmethod
+    def _pdf_chunks(images):
+        pdf = _PdfStream()
+        yield pdf.begin()
+        for image in images:
+            yield pdf.add_jpeg_page(image["content"])
+        yield pdf.end()
+
+    @staticmethod
+    def generate_many_certificates(
+        data: dict, progress_callback=None, cache=None, options=None
+    ):
+        return b"".join(
+            Certificates.stream_many_certificates(
+                data, progress_callback, cache, options
+            )
+        )
+
+
+class _ZipStream:
+    """
+    Write-only, non-seekable buffer for zipfile. Chunks are handed out with
+    pop() as soon as they are written, so the archive is never held whole.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _PdfStream:
+    """
+    Minimal streaming PDF writer: one JPEG image per page, embedded as-is
+    with DCTDecode. Objects are written as pages arrive; the page tree,
+    catalog and cross-reference table follow the last page.
+    """
+
+    def __init__(self):
+        self._offset = 0
+        self._offsets = {}
+        self._pages = []
+        # 1 and 2 are reserved for the catalog and page tree
+        self._next_number = 3
+
+    def _object(self, number, body, stream=None):
+        self._offsets[number] = self._offset
+        data = f"{number} 0 obj\n".encode() + body
+        if stream is not None:
+            data += b"\nstream\n" + stream + b"\nendstream"
+        data += b"\nendobj\n"
+        self._offset += len(data)
+        return data
+
+    def begin(self):
+        header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self._offset += len(header)
+        return header
+
+    def add_jpeg_page(self, content):
+        with Image.open(io.BytesIO(content)) as img:
+            width, height = img.size
+        # Pixels to points at PDF_DPI
+        page_width = width * 72 / PDF_DPI
+        page_height = height * 72 / PDF_DPI
+
+        image_number, contents_number, page_number = range(
+            self._next_number, self._next_number + 3
+        )
+        self._next_number += 3
+        self._pages.append(page_number)
+
+        drawing = f"q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im0 Do Q".encode()
+        return b"".join(
+            [
+                self._object(
+                    image_number,
+                    (
+                        f"<< /Type /XObject /Subtype /Image /Width {width} "
+                        f"/Height {height} /ColorSpace /DeviceRGB "
+                        f"/BitsPerComponent 8 /Filter /DCTDecode "
+                        f"/Length {len(content)} >>"
+                    ).encode(),
+                    content,
+                ),
+                self._object(
+                    contents_number,
+                    f"<< /Length {len(drawing)} >>".encode(),
+                    drawing,
+                ),
+                self._object(
+                    page_number,
+                    (
+                        f"<< /Type /Page /Parent 2 0 R "
+                        f"/MediaBox [0 0 {page_width:.2f} {page_height:.2f}] "
+                        f"/Resources << /XObject << /Im0 {image_number} 0 R >> >> "
+                        f"/Contents {contents_number} 0 R >>"
+                    ).encode(),
+                ),
+            ]
+        )
+
+    def end(self):
+        kids = " ".join(f"{number} 0 R" for number in self._pages)
+        data = self._object(
+            2,
+            f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>".encode(),
+        )
+        data += self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_offset = self._offset
+        size = self._next_number
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        lines += [f"{self._offsets[number]:010d} 00000 n \n" for number in range(1, size)]
+        lines.append(
+            f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+        )
+        return data + "".join(lines).encode()
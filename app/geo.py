@@ -0,0 +1,89 @@
+import math
+from django.db.models import Q
+
+EARTH_RADIUS_KM = 6371.0088
+# Half the circumference: no two points on Earth are further apart
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# First box searched for the k nearest; widened 4x until it holds k
+NEARBY_INITIAL_RADIUS_KM = 25
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lon, radius_km):
+    """
+    ((min_lat, max_lat), [(min_lon, max_lon), ...]) enclosing every point
+    within radius_km. Boxes crossing the antimeridian are split in two.
+    """
+    delta_lat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(-90.0, lat - delta_lat), min(90.0, lat + delta_lat)
+    if min_lat == -90.0 or max_lat == 90.0:
+        # The circle reaches a pole, so it spans every longitude
+        return (min_lat, max_lat), [(-180.0, 180.0)]
+
+    # Longitude span at the circle's widest point, which lies poleward of lat
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat))
+    if ratio >= 1:
+        return (min_lat, max_lat), [(-180.0, 180.0)]
+    delta_lon = math.degrees(math.asin(ratio))
+    min_lon, max_lon = lon - delta_lon, lon + delta_lon
+    if min_lon < -180.0:
+        return (min_lat, max_lat), [(min_lon + 360.0, 180.0), (-180.0, max_lon)]
+    if max_lon > 180.0:
+        return (min_lat, max_lat), [(min_lon, 180.0), (-180.0, max_lon - 360.0)]
+    return (min_lat, max_lat), [(min_lon, max_lon)]
+
+
+def nearest(points, lat, lon, radius_km=None, k=None):
+    """
+    Rank (key, lat, lon) points by distance from (lat, lon); returns
+    [(distance_km, key)] within radius_km and/or the k nearest.
+    """
+    ranked = sorted(
+        (haversine_km(lat, lon, point_lat, point_lon), key)
+        for key, point_lat, point_lon in points
+    )
+    if radius_km is not None:
+        ranked = [item for item in ranked if item[0] <= radius_km]
+    return ranked[:k] if k is not None else ranked
+
+
+def within_box(queryset, lat, lon, radius_km):
+    """
+    Rows whose latitude/longitude fall in the box around the circle, an
+    index range scan on (latitude, longitude).
+    """
+    (min_lat, max_lat), lon_ranges = bounding_box(lat, lon, radius_km)
+    lon_filter = Q()
+    for min_lon, max_lon in lon_ranges:
+        lon_filter |= Q(longitude__range=(min_lon, max_lon))
+    return queryset.filter(lon_filter, latitude__range=(min_lat, max_lat))
+
+
+def find_nearest(queryset, lat, lon, k, radius_km=None):
+    """
+    [(distance_km, pk)] for the k rows nearest to (lat, lon), optionally only
+    those within radius_km. Only rows inside a bounding box are ranked; the
+    box grows until it holds k rows within its radius, which are then the
+    true k nearest.
+    """
+    if radius_km is None:
+        radius_km = MAX_DISTANCE_KM
+    max_radius = min(radius_km, MAX_DISTANCE_KM)
+    search_radius = min(NEARBY_INITIAL_RADIUS_KM, max_radius)
+    while True:
+        points = within_box(queryset, lat, lon, search_radius).values_list(
+            "pk", "latitude", "longitude"
+        )
+        ranked = nearest(points, lat, lon, search_radius, k)
+        if len(ranked) >= k or search_radius >= max_radius:
+            return ranked
+        search_radius = min(search_radius * 4, max_radius)
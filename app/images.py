@@ -0,0 +1,69 @@
+import io
+import os
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+def normalize_course_image(upload):
+    """
+    Decode an uploaded course background once and return (master, thumbnail,
+    scale). The master is upright (EXIF orientation applied), RGB like the
+    rendered certificates, and its longest side is capped at
+    COURSE_IMAGE_MAX_SIZE; scale is the resize factor applied to it.
+    """
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    upload.seek(0)
+    with Image.open(upload) as img:
+        source_format = img.format
+        img = ImageOps.exif_transpose(img).convert("RGB")
+
+    scale = min(1.0, settings.COURSE_IMAGE_MAX_SIZE / max(img.size))
+    if scale < 1:
+        size = (round(img.width * scale), round(img.height * scale))
+        img = img.resize(size, Image.Resampling.LANCZOS)
+
+    # Photos stay JPEG; anything else (mostly PNG artwork) stays lossless
+    buffer = io.BytesIO()
+    if source_format == "JPEG":
+        img.save(buffer, format="JPEG", quality=90, optimize=True)
+        master = ContentFile(buffer.getvalue(), name=f"{stem}.jpg")
+    else:
+        img.save(buffer, format="PNG", optimize=True)
+        master = ContentFile(buffer.getvalue(), name=f"{stem}.png")
+
+    return master, make_thumbnail(img, stem), scale
+
+
+def make_thumbnail(img, stem):
+    """
+    JPEG rendition of an upright RGB image fitting COURSE_THUMBNAIL_SIZE.
+    """
+    img = img.copy()
+    img.thumbnail((settings.COURSE_THUMBNAIL_SIZE, settings.COURSE_THUMBNAIL_SIZE))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=80, optimize=True)
+    return ContentFile(buffer.getvalue(), name=f"{stem}.jpg")
+
+
+def make_course_thumbnail(image_file):
+    """
+    Thumbnail for an already stored course image.
+    """
+    stem = os.path.splitext(os.path.basename(image_file.name))[0]
+    with image_file.open("rb"), Image.open(image_file) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    return make_thumbnail(img, stem)
+
+
+def scale_coordinates(coordinates, scale):
+    if not coordinates:
+        return coordinates
+    return {
+        key: (
+            round(value * scale)
+            if key in ("x", "y", "size") and isinstance(value, (int, float))
+            else value
+        )
+        for key, value in coordinates.items()
+    }
@@ -0,0 +1,141 @@
+import csv
+import datetime
+import io
+import itertools
+import os
+from collections import Counter
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+from .models import (
+    Course,
+    Certificate,
+    allocate_certificate_ids,
+    adjust_certificate_counts,
+)
+from .serializers import CertificateImportRowSerializer
+
+# Keep the number of reported row errors (and the response) bounded
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFileError(Exception):
+    pass
+
+
+def iter_csv_rows(upload):
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.reader(text)
+    except (csv.Error, UnicodeDecodeError):
+        raise ImportFileError("Could not read the CSV file; it must be UTF-8.")
+    finally:
+        text.detach()
+
+
+def iter_xlsx_rows(upload):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError("XLSX import requires the openpyxl package.")
+
+    try:
+        # read_only streams rows from the sheet XML instead of loading it
+        workbook = load_workbook(upload.file, read_only=True, data_only=True)
+    except Exception:
+        raise ImportFileError("Could not read the XLSX file.")
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def normalize_cell(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def iter_records(upload):
+    """
+    Yield (row_number, record) for each data row, keyed by the header row.
+    Empty cells are left out so optional fields fall back to their defaults.
+    """
+    extension = os.path.splitext(upload.name)[1].lower()
+    if extension == ".csv":
+        rows = iter_csv_rows(upload)
+    elif extension == ".xlsx":
+        rows = iter_xlsx_rows(upload)
+    else:
+        raise ImportFileError("Unsupported file type; upload a .csv or .xlsx file.")
+
+    header = next(rows, None)
+    if not header:
+        raise ImportFileError("The file is empty.")
+    header = [str(column or "").strip().lower() for column in header]
+    if "name" not in header:
+        raise ImportFileError("The header row must contain a 'name' column.")
+
+    for row_number, row in enumerate(rows, start=2):
+        record = {}
+        for column, value in zip(header, row):
+            value = normalize_cell(value)
+            if column and value is not None:
+                record[column] = value
+        if record:
+            yield row_number, record
+
+
+def import_certificates(certificates_set, upload, batch_size=None):
+    """
+    Validate every row with CertificateImportRowSerializer and bulk insert the
+    valid ones into the set in batches. Returns a summary with per-row errors.
+    """
+    if batch_size is None:
+        batch_size = settings.CERTIFICATE_IMPORT_BATCH_SIZE
+
+    row_serializer = CertificateImportRowSerializer(
+        context={"course_ids": set(Course.objects.values_list("id", flat=True))}
+    )
+    created = failed = 0
+    errors = []
+
+    def valid_certificates():
+        nonlocal failed
+        for row_number, record in iter_records(upload):
+            try:
+                yield row_serializer.run_validation(record)
+            except serializers.ValidationError as e:
+                failed += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"row": row_number, "errors": e.detail})
+
+    with transaction.atomic():
+        certificates = valid_certificates()
+        while batch := list(itertools.islice(certificates, batch_size)):
+            ids = allocate_certificate_ids(len(batch))
+            Certificate.objects.bulk_create(
+                [
+                    Certificate(
+                        UUID=certificate_id,
+                        certificates_set=certificates_set,
+                        **fields,
+                    )
+                    for certificate_id, fields in zip(ids, batch)
+                ]
+            )
+            # bulk_create skips Certificate.save, which keeps the counters
+            adjust_certificate_counts(
+                {certificates_set.pk: len(batch)},
+                Counter(fields.get("course_id") for fields in batch),
+            )
+            created += len(batch)
+
+    return {"created": created, "failed": failed, "errors": errors}
@@ -0,0 +1,73 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Bound SQL kept per request for the slow request log
+MAX_CAPTURED_QUERIES = 200
+
+_current = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """
+    Durations (in ms) collected while handling one request, by metric name.
+    """
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.queries = []
+        self._active = set()
+
+    def add(self, name, duration_ms):
+        self.durations[name] += duration_ms
+        self.counts[name] += 1
+
+    def record_query(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            self.add("db", duration_ms)
+            if len(self.queries) < MAX_CAPTURED_QUERIES:
+                self.queries.append({"sql": sql, "ms": round(duration_ms, 2)})
+
+    @contextmanager
+    def timed(self, name):
+        # Nested timers of the same name (nested serializers) count once
+        if name in self._active:
+            yield
+            return
+        self._active.add(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._active.discard(name)
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+
+@contextmanager
+def collect_timings():
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the duration of the block to the current request's timings, if any.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+    else:
+        with timings.timed(name):
+            yield
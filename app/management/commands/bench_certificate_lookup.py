@@ -0,0 +1,166 @@
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+from app.models import StudyCenter, Course, Certificate, CertificatesSet
+from app.serializers import (
+    CertificateSerializer,
+    CourseSerializer,
+    CertificatesSetSerializer,
+    StudyCenterSerializer,
+)
+from app.views import certificate_by_uuid
+
+
+def legacy_lookup(uuid):
+    # The query chain certificate_by_uuid ran before it was cached
+    certificate = Certificate.objects.get(UUID=uuid)
+    response_data = CertificateSerializer(certificate).data
+    certificate_set = CertificatesSet.objects.filter(
+        certificates__in=[certificate]
+    ).first()
+    response_data["course"] = CourseSerializer(certificate.course).data
+    response_data["certificates_set"] = CertificatesSetSerializer(
+        certificate_set
+    ).data
+    response_data["study_center"] = StudyCenterSerializer(
+        certificate_set.study_center
+    ).data["name"]
+    return response_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark certificate_by_uuid latency (legacy query chain, uncached "
+        "and cached) on synthetic data in a scratch SQLite database and "
+        "cache, leaving the configured ones untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--certificates", type=int, default=1000)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=8)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.scratch_database(os.path.join(directory, "bench.sqlite3")):
+                self.benchmark(options)
+
+    @contextmanager
+    def scratch_database(self, path):
+        """
+        Point the default alias (which the view queries) and the caches at
+        scratch stores for the duration of the benchmark.
+        """
+        original = connections.settings["default"]
+        scratch = {"ENGINE": "django.db.backends.sqlite3", "NAME": path}
+        bench_caches = {
+            alias: {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": f"bench-{alias}",
+            }
+            for alias in ("default", "responses")
+        }
+        connections["default"].close()
+        connections.settings["default"] = connections.configure_settings(
+            {"default": scratch}
+        )["default"]
+        del connections["default"]
+        try:
+            with override_settings(CACHES=bench_caches):
+                call_command("migrate", interactive=False, verbosity=0)
+                yield
+        finally:
+            connections["default"].close()
+            connections.settings["default"] = original
+            del connections["default"]
+
+    def benchmark(self, options):
+        study_center = StudyCenter.objects.create(
+            name="Benchmark center",
+            location="https://maps.google.com/@41.3,69.2",
+            latitude=41.3,
+            longitude=69.2,
+        )
+        uuids = self.create_certificates(study_center, options["certificates"])
+        factory = APIRequestFactory()
+        lookup_cache = caches["responses"]
+
+        def view_lookup(uuid):
+            request = factory.get(f"/api/get-certificate/{uuid}/")
+            return certificate_by_uuid(request, uuid=uuid)
+
+        def uncached_lookup(uuid):
+            lookup_cache.clear()
+            return view_lookup(uuid)
+
+        for label, lookup in (
+            ("legacy", legacy_lookup),
+            ("uncached", uncached_lookup),
+            ("cached", view_lookup),
+        ):
+            lookup_cache.clear()
+            samples = self.measure(lookup, uuids, options)
+            self.report(label, samples)
+
+    def create_certificates(self, study_center, count):
+        coordinates = {"x": 100, "y": 100, "size": 20}
+        course = Course.objects.create(
+            name="Benchmark course",
+            image="courses/benchmark.png",
+            name_coordinates=coordinates,
+            id_coordinates=coordinates,
+            finished_date_coordinates=coordinates,
+            qr_code_coordinates=coordinates,
+        )
+        certificates_set = CertificatesSet.objects.create(
+            name="Benchmark set",
+            study_center=study_center,
+            finished_date=datetime.date.today(),
+        )
+        for i in range(count):
+            Certificate.objects.create(
+                name=f"Student {i}", certificates_set=certificates_set, course=course
+            )
+        return list(certificates_set.certificates.values_list("UUID", flat=True))
+
+    def measure(self, lookup, uuids, options):
+        def timed(uuid):
+            start = time.perf_counter()
+            lookup(uuid)
+            return (time.perf_counter() - start) * 1000
+
+        def worker(batch):
+            try:
+                return [timed(uuid) for uuid in batch]
+            finally:
+                connection.close()
+
+        requests = [random.choice(uuids) for _ in range(options["requests"])]
+        concurrency = options["concurrency"]
+        batches = [requests[i::concurrency] for i in range(concurrency)]
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = [
+                sample
+                for batch_samples in executor.map(worker, batches)
+                for sample in batch_samples
+            ]
+        connections.close_all()
+        return samples
+
+    def report(self, label, samples):
+        percentiles = statistics.quantiles(samples, n=100)
+        self.stdout.write(
+            f"{label:>9}: p50 {percentiles[49]:7.2f} ms  "
+            f"p99 {percentiles[98]:7.2f} ms  ({len(samples)} requests)"
+        )
@@ -0,0 +1,91 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from app.geo import find_nearest, nearest
+from app.models import StudyCenter
+
+BENCHMARK_ALIAS = "bench_nearby"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the nearby study center search (bounding box + haversine) "
+        "against a full scan on synthetic centers in a scratch SQLite database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--centers", type=int, default=5000)
+        parser.add_argument("--queries", type=int, default=500)
+        parser.add_argument("--k", type=int, default=10)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            self.add_database(os.path.join(directory, "nearby.sqlite3"))
+            try:
+                self.benchmark(options)
+            finally:
+                connections[BENCHMARK_ALIAS].close()
+                del connections.settings[BENCHMARK_ALIAS]
+
+    def add_database(self, path):
+        database = {"ENGINE": "django.db.backends.sqlite3", "NAME": path}
+        configured = connections.configure_settings(
+            {**settings.DATABASES, BENCHMARK_ALIAS: database}
+        )
+        connections.settings[BENCHMARK_ALIAS] = configured[BENCHMARK_ALIAS]
+        call_command(
+            "migrate", database=BENCHMARK_ALIAS, interactive=False, verbosity=0
+        )
+
+    def benchmark(self, options):
+        # Spread over Central Asia, roughly Uzbekistan and its neighbours
+        StudyCenter.objects.using(BENCHMARK_ALIAS).bulk_create(
+            StudyCenter(
+                name="Benchmark nearby center",
+                location="https://maps.google.com/@41.3,69.2",
+                latitude=random.uniform(37.0, 46.0),
+                longitude=random.uniform(56.0, 74.0),
+            )
+            for _ in range(options["centers"])
+        )
+        queryset = StudyCenter.objects.using(BENCHMARK_ALIAS).filter(active=True)
+        points = [
+            (random.uniform(37.0, 46.0), random.uniform(56.0, 74.0))
+            for _ in range(options["queries"])
+        ]
+        k = options["k"]
+
+        def full_scan(lat, lon):
+            rows = queryset.values_list("pk", "latitude", "longitude")
+            return nearest(rows, lat, lon, k=k)
+
+        def bounding_box(lat, lon):
+            return find_nearest(queryset, lat, lon, k)
+
+        for lat, lon in points[:20]:
+            if full_scan(lat, lon) != bounding_box(lat, lon):
+                self.stderr.write(f"Results differ at ({lat}, {lon})")
+
+        for label, search in (("full scan", full_scan), ("bbox", bounding_box)):
+            self.report(label, self.measure(search, points))
+
+    def measure(self, search, points):
+        samples = []
+        for lat, lon in points:
+            start = time.perf_counter()
+            search(lat, lon)
+            samples.append((time.perf_counter() - start) * 1000)
+        return samples
+
+    def report(self, label, samples):
+        percentiles = statistics.quantiles(samples, n=100)
+        self.stdout.write(
+            f"{label:>9}: p50 {percentiles[49]:7.2f} ms  "
+            f"p99 {percentiles[98]:7.2f} ms  ({len(samples)} queries)"
+        )
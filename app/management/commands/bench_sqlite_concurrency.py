@@ -0,0 +1,189 @@
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import (
+    OperationalError,
+    close_old_connections,
+    connections,
+    transaction,
+)
+from django.db.models import F
+from django.utils import timezone
+from app.models import (
+    StudyCenter,
+    Course,
+    Certificate,
+    CertificatesSet,
+    CertificateRenderJob,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrent certificate lookups against a render job writer "
+        "on scratch SQLite databases, with the default settings and with "
+        "SQLITE_PRODUCTION_PROFILE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--certificates", type=int, default=2000)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--write-batch", type=int, default=200)
+
+    def handle(self, *args, **options):
+        profiles = (
+            ("default", {}),
+            ("production", settings.SQLITE_PRODUCTION_PROFILE),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for label, profile in profiles:
+                alias = f"bench_{label}"
+                path = os.path.join(directory, f"{label}.sqlite3")
+                self.add_database(alias, path, profile)
+                try:
+                    uuids, job_id = self.prepare(alias, options["certificates"])
+                    self.report(label, self.measure(alias, uuids, job_id, options))
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+
+    def add_database(self, alias, path, profile):
+        database = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": path,
+            **profile,
+        }
+        configured = connections.configure_settings(
+            {**settings.DATABASES, alias: database}
+        )
+        connections.settings[alias] = configured[alias]
+
+    def prepare(self, alias, count):
+        call_command("migrate", database=alias, interactive=False, verbosity=0)
+        coordinates = {"x": 100, "y": 100, "size": 20}
+        study_center = StudyCenter.objects.using(alias).create(
+            name="Benchmark center",
+            location="https://maps.google.com/@41.3,69.2",
+            latitude=41.3,
+            longitude=69.2,
+        )
+        course = Course.objects.using(alias).create(
+            name="Benchmark course",
+            image="courses/benchmark.png",
+            name_coordinates=coordinates,
+            id_coordinates=coordinates,
+            finished_date_coordinates=coordinates,
+            qr_code_coordinates=coordinates,
+        )
+        certificates_set = CertificatesSet.objects.using(alias).create(
+            name="Benchmark set",
+            study_center=study_center,
+            finished_date=datetime.date.today(),
+        )
+        Certificate.objects.using(alias).bulk_create(
+            Certificate(
+                UUID=f"BENCH{i}",
+                name=f"Student {i}",
+                certificates_set=certificates_set,
+                course=course,
+            )
+            for i in range(count)
+        )
+        job = CertificateRenderJob.objects.using(alias).create(
+            certificates_set=certificates_set,
+            status="running",
+            total=count,
+        )
+        connections[alias].close()
+        return [f"BENCH{i}" for i in range(count)], job.id
+
+    def measure(self, alias, uuids, job_id, options):
+        certificates = Certificate.objects.using(alias)
+        results = {"reads": [], "writes": [], "read_errors": 0, "write_errors": 0}
+        lock = threading.Lock()
+        readers_done = threading.Event()
+
+        def reader(batch):
+            samples, errors = [], 0
+            try:
+                for uuid in batch:
+                    start = time.perf_counter()
+                    # Mirror a request: Django closes obsolete connections
+                    # when a request starts and finishes
+                    close_old_connections()
+                    try:
+                        certificates.select_related(
+                            "course", "certificates_set__study_center"
+                        ).get(UUID=uuid)
+                    except OperationalError:
+                        errors += 1
+                    close_old_connections()
+                    samples.append((time.perf_counter() - start) * 1000)
+            finally:
+                connections[alias].close()
+            with lock:
+                results["reads"].extend(samples)
+                results["read_errors"] += errors
+
+        def writer():
+            # Progress updates like run_job's, touching a batch of rows
+            # to hold the write lock for a realistic amount of time
+            samples, errors = [], 0
+            try:
+                while not readers_done.is_set():
+                    start = time.perf_counter()
+                    offset = random.randrange(len(uuids))
+                    batch = uuids[offset : offset + options["write_batch"]]
+                    try:
+                        with transaction.atomic(using=alias):
+                            CertificateRenderJob.objects.using(alias).filter(
+                                pk=job_id
+                            ).update(processed=F("processed") + 1)
+                            certificates.filter(UUID__in=batch).update(
+                                updated_at=timezone.now()
+                            )
+                    except OperationalError:
+                        errors += 1
+                    samples.append((time.perf_counter() - start) * 1000)
+            finally:
+                connections[alias].close()
+            results["writes"] = samples
+            results["write_errors"] = errors
+
+        requests = [random.choice(uuids) for _ in range(options["requests"])]
+        concurrency = options["readers"]
+        batches = [requests[i::concurrency] for i in range(concurrency)]
+        write_thread = threading.Thread(target=writer)
+        start = time.perf_counter()
+        write_thread.start()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(reader, batches))
+        readers_done.set()
+        write_thread.join()
+        results["elapsed"] = time.perf_counter() - start
+        return results
+
+    def report(self, label, results):
+        reads = statistics.quantiles(results["reads"], n=100)
+        writes = results["writes"]
+        write_p99 = statistics.quantiles(writes, n=100)[98] if len(writes) > 1 else 0
+        elapsed = results["elapsed"]
+        self.stdout.write(
+            f"{label:>10}: reads {len(results['reads']) / elapsed:7.0f}/s  "
+            f"p50 {reads[49]:6.2f} ms  p99 {reads[98]:7.2f} ms  "
+            f"errors {results['read_errors']}"
+        )
+        self.stdout.write(
+            f"{'':>10}  writes {len(writes) / elapsed:6.0f}/s  "
+            f"p99 {write_p99:7.2f} ms  "
+            f"errors {results['write_errors']}"
+        )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from app.images import make_course_thumbnail
+from app.models import Course
+
+
+class Command(BaseCommand):
+    help = (
+        "Make thumbnails for courses uploaded before thumbnails existed. "
+        "Uploads make their own thumbnails."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Remake every course's thumbnail, not only the missing ones.",
+        )
+
+    def handle(self, *args, **options):
+        courses = Course.objects.exclude(image="")
+        if not options["all"]:
+            courses = courses.filter(Q(thumbnail=None) | Q(thumbnail=""))
+
+        made = 0
+        for course in courses.iterator():
+            try:
+                thumbnail = make_course_thumbnail(course.image)
+            except OSError as e:
+                self.stderr.write(f"Course {course.pk} ({course.image.name}): {e}")
+                continue
+            course.thumbnail.save(thumbnail.name, thumbnail, save=False)
+            # Leaves updated_at alone; the signals still refresh cached responses
+            course.save(update_fields=["thumbnail"])
+            made += 1
+        self.stdout.write(self.style.SUCCESS(f"Made {made} thumbnails."))
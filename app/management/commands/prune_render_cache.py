@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from app.render_cache import get_render_cache
+
+
+class Command(BaseCommand):
+    help = "Evict least recently used rendered certificates from the disk cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-bytes",
+            type=int,
+            default=None,
+            help="Size to prune down to (defaults to CERTIFICATE_RENDER_CACHE_MAX_BYTES).",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Remove every cached image.",
+        )
+
+    def handle(self, *args, **options):
+        cache = get_render_cache()
+        if cache is None:
+            raise CommandError("CERTIFICATE_RENDER_CACHE_DIR is not configured.")
+
+        max_bytes = 0 if options["clear"] else options["max_bytes"]
+        removed, freed = cache.prune(max_bytes)
+        self.stdout.write(
+            self.style.SUCCESS(f"Removed {removed} files ({freed} bytes).")
+        )
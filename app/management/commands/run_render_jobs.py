@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from app.render_jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Claim and run queued certificate render jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when the queue is empty instead of polling.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=None,
+            help="Seconds to sleep between polls of an empty queue.",
+        )
+
+    def handle(self, *args, **options):
+        for job in run_worker(
+            once=options["once"], poll_interval=options["poll_interval"]
+        ):
+            message = f"Job {job.pk} for '{job.certificates_set}': {job.status}"
+            if job.status == "completed":
+                self.stdout.write(self.style.SUCCESS(message))
+            else:
+                self.stdout.write(self.style.WARNING(f"{message} {job.error}".strip()))
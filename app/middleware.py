@@ -0,0 +1,58 @@
+import json
+import logging
+import time
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from .instrumentation import collect_timings
+
+logger = logging.getLogger("app.performance")
+
+
+class ServerTimingMiddleware:
+    """
+    Reports where each request's time went: database queries, serializers,
+    certificate rendering and the total. Timings are sent as Server-Timing
+    response headers and logged as one JSON line per request; requests
+    slower than SERVER_TIMING_SLOW_REQUEST_MS also log their SQL.
+
+    Streaming responses (archives) render after the view returns, so their
+    render time is not included.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "SERVER_TIMING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with collect_timings() as timings:
+            with connection.execute_wrapper(timings.record_query):
+                response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        queries = timings.counts["db"]
+        metrics = [f'db;dur={timings.durations["db"]:.2f};desc="{queries} queries"']
+        for name in ("serialize", "render"):
+            if name in timings.durations:
+                metrics.append(f"{name};dur={timings.durations[name]:.2f}")
+        metrics.append(f"total;dur={total_ms:.2f}")
+        response["Server-Timing"] = ", ".join(metrics)
+
+        entry = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total_ms, 2),
+            "db_queries": queries,
+            "db_ms": round(timings.durations["db"], 2),
+            "serialize_ms": round(timings.durations["serialize"], 2),
+            "render_ms": round(timings.durations["render"], 2),
+        }
+        if total_ms >= settings.SERVER_TIMING_SLOW_REQUEST_MS:
+            entry["queries"] = timings.queries
+            logger.warning(json.dumps(entry))
+        else:
+            logger.info(json.dumps(entry))
+        return response
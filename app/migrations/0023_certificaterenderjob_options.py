@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_certificaterenderjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificaterenderjob',
+            name='options',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
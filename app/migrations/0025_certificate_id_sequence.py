@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-17 20:01
+
+import app.models
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    # Existing "ID" + 5 digit IDs stay as issued; the counter's IDs have 6+
+    # digits, so allocation can start from zero without clashing with them.
+    CertificateIdSequence = apps.get_model("app", "CertificateIdSequence")
+    CertificateIdSequence.objects.using(schema_editor.connection.alias).get_or_create(
+        pk=1, defaults={"last_value": 0}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0024_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CertificateIdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='certificate',
+            name='UUID',
+            field=models.CharField(default=app.models.generate_short_uuid, editable=False, max_length=12, unique=True),
+        ),
+        migrations.RunPython(create_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-17 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_certificate_id_sequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='certificate',
+            index=models.Index(condition=models.Q(('active', True)), fields=['certificates_set'], name='certificate_active_set_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='certificate',
+            index=models.Index(condition=models.Q(('active', True)), fields=['course'], name='certificate_active_course_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='certificate',
+            index=models.Index(condition=models.Q(('active', True)), fields=['name'], name='certificate_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='certificatesset',
+            index=models.Index(condition=models.Q(('active', True)), fields=['study_center', 'status'], name='certset_active_center_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='certificatesset',
+            index=models.Index(condition=models.Q(('active', True)), fields=['status'], name='certset_active_status_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.6 on 2026-10-17 20:14
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counts(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Certificate = apps.get_model("app", "Certificate")
+    for model_name, field in (
+        ("CertificatesSet", "certificates_set"),
+        ("Course", "course"),
+    ):
+        count = (
+            Certificate.objects.using(db_alias)
+            .filter(active=True, **{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        apps.get_model("app", model_name).objects.using(db_alias).update(
+            certificates_count=Coalesce(Subquery(count), 0)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0026_api_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificatesset',
+            name='certificates_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='certificates_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
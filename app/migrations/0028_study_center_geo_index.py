@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-17 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0027_certificates_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studycenter',
+            index=models.Index(condition=models.Q(('active', True)), fields=['latitude', 'longitude'], name='studycenter_active_geo_idx'),
+        ),
+    ]
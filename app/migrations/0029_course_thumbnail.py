@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0028_study_center_geo_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='courses/thumbnails'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 20:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0029_course_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificaterenderjob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
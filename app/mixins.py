@@ -0,0 +1,178 @@
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.response import Response
+from .caching import get_response_version, response_key
+from .instrumentation import timed
+
+
+def is_enabled(value):
+    return value is not None and value.lower() not in ("", "false", "0")
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin accepting `fields` and `omit` keyword arguments that
+    trim the serialized fields to a subset of the declared ones, and
+    expanding related fields into nested serializers when the request asks
+    for them with a display* query parameter.
+    """
+
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        self._selected_fields = fields
+        self._omitted_fields = omit
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self._selected_fields is not None:
+            fields = {
+                name: field
+                for name, field in fields.items()
+                if name in self._selected_fields
+            }
+        if self._omitted_fields is not None:
+            fields = {
+                name: field
+                for name, field in fields.items()
+                if name not in self._omitted_fields
+            }
+
+        request = self.context.get("request", None)
+        if request and request.method == "GET":
+            expandable_fields = self.get_expandable_fields()
+            for name, (param, serializer_class) in expandable_fields.items():
+                if name in fields and is_enabled(request.GET.get(param)):
+                    fields[name] = serializer_class(
+                        read_only=True, context=self.context
+                    )
+        return fields
+
+    def to_representation(self, instance):
+        with timed("serialize"):
+            return super().to_representation(instance)
+
+    def get_expandable_fields(self):
+        """
+        Map of field name to (query parameter, serializer class) for the
+        relations that can be expanded into nested objects.
+        """
+        return {}
+
+    def get_select_related(self):
+        """
+        Relation paths the expanded fields read, nested expansions included,
+        for QuerySet.select_related().
+        """
+        related = []
+        for field in self.fields.values():
+            if isinstance(field, DynamicFieldsMixin):
+                related.append(field.source)
+                related.extend(
+                    f"{field.source}__{path}" for path in field.get_select_related()
+                )
+        return related
+
+    def get_only_fields(self):
+        """
+        Model fields backing the readable fields, for QuerySet.only(). None
+        when a field reads anything other than a concrete model field.
+        """
+        model = self.Meta.model
+        names = {model._meta.pk.name}
+        for field in self.fields.values():
+            if field.write_only:
+                continue
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                return None
+            if not model_field.concrete or model_field.many_to_many:
+                return None
+            names.add(model_field.name)
+        return names
+
+
+class DynamicFieldsViewSetMixin:
+    """
+    Reads comma separated `?fields=` and `?omit=` on GET requests, passes
+    them to the serializer and loads only the matching columns. Relations
+    the serializer expands are fetched in the same query.
+    """
+
+    dynamic_fields_actions = ("list", "retrieve")
+
+    def get_sparse_fields(self):
+        request = getattr(self, "request", None)
+        if request is None or request.method not in ("GET", "HEAD"):
+            return {}
+
+        sparse_fields = {}
+        for param in ("fields", "omit"):
+            value = request.query_params.get(param)
+            if value:
+                sparse_fields[param] = {
+                    name.strip() for name in value.split(",") if name.strip()
+                }
+        return sparse_fields
+
+    def get_serializer(self, *args, **kwargs):
+        for param, names in self.get_sparse_fields().items():
+            kwargs.setdefault(param, names)
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action not in self.dynamic_fields_actions:
+            return queryset
+
+        serializer = self.get_serializer()
+        select_related = serializer.get_select_related()
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if self.get_sparse_fields():
+            only_fields = serializer.get_only_fields()
+            if only_fields:
+                queryset = queryset.only(*only_fields)
+        return queryset
+
+
+class VersionedResponseCacheMixin:
+    """
+    Caches list and retrieve responses in the "responses" cache. Keys embed
+    the version counters of cache_models, which every save or delete bumps,
+    so a change makes old entries unreachable and they simply expire.
+    Entries vary by the full URL (scheme, host and query string) and by the
+    user's scope.
+    """
+
+    cache_models = ()
+
+    def get_cache_scope(self):
+        user = self.request.user
+        if user.is_manager and not user.is_staff:
+            return f"center:{user.study_center_id}"
+        return "all"
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        response_cache = caches["responses"]
+        key = response_key(
+            type(self).__name__,
+            get_response_version(self.cache_models),
+            self.get_cache_scope(),
+            # Bodies hold absolute URLs (files, pagination links)
+            request.build_absolute_uri(),
+        )
+        data = response_cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response_cache.set(key, response.data)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
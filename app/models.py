@@ -1,11 +1,73 @@
-from django.db import models
+from collections import Counter
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from .managers import CustomUserManager
-import uuid
+from .cerificate_generator import Certificates
+from .caching import invalidate_cached_users, bump_response_version
+from .images import normalize_course_image, scale_coordinates
+import hashlib
+
+
+# Legacy IDs were "ID" + 5 random digits. New IDs are drawn from a counter
+# and always have 6 or more digits, so they can never clash with them.
+CERTIFICATE_ID_MIN_DIGITS = 6
+# Coprime with every 9 * 10**k block size, which makes the scramble bijective
+CERTIFICATE_ID_MULTIPLIER = 7919
+CERTIFICATE_ID_OFFSET = 12345
+
+
+def format_certificate_id(number):
+    """
+    Map the n-th allocated number to a printable certificate ID. Each block
+    of equal-length IDs is permuted so consecutive allocations don't look
+    consecutive; the mapping is one-to-one, so IDs never collide.
+    """
+    digits = CERTIFICATE_ID_MIN_DIGITS
+    block_size = 9 * 10 ** (digits - 1)
+    while number >= block_size:
+        number -= block_size
+        digits += 1
+        block_size = 9 * 10 ** (digits - 1)
+
+    scrambled = (number * CERTIFICATE_ID_MULTIPLIER + CERTIFICATE_ID_OFFSET) % block_size
+    return f"ID{10 ** (digits - 1) + scrambled}"
+
+
+def allocate_certificate_ids(count):
+    """
+    Reserve a block of count certificate IDs with one counter update.
+    """
+    with transaction.atomic():
+        updated = CertificateIdSequence.objects.filter(pk=1).update(
+            last_value=F("last_value") + count
+        )
+        if not updated:
+            CertificateIdSequence.objects.get_or_create(pk=1)
+            CertificateIdSequence.objects.filter(pk=1).update(
+                last_value=F("last_value") + count
+            )
+        end = CertificateIdSequence.objects.values_list(
+            "last_value", flat=True
+        ).get(pk=1)
+    return [format_certificate_id(number) for number in range(end - count, end)]
 
 
 def generate_short_uuid():
-    return f"ID{str(uuid.uuid4().int)[:5]}"
+    return allocate_certificate_ids(1)[0]
+
+
+class CertificateIdSequence(models.Model):
+    """
+    Single-row counter behind allocate_certificate_ids.
+    """
+
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.last_value)
 
 
 class StudyCenter(models.Model):
@@ -36,6 +98,9 @@ class StudyCenter(models.Model):
         # If there was a previous manager, clear their study_center field
         if old_manager and old_manager != self.manager_id:
             CustomUser.objects.filter(pk=old_manager).update(study_center=None)
+            # update() skips signals, so drop the cached user here
+            invalidate_cached_users([old_manager])
+            bump_response_version(CustomUser)
 
         if self.manager:
             self.manager.study_center = self
@@ -47,6 +112,14 @@ class StudyCenter(models.Model):
     class Meta:
         verbose_name = "O'quv Markaz"
         verbose_name_plural = "O'quv Markazlari"
+        indexes = [
+            # Bounding-box prefilter of the nearby search
+            models.Index(
+                fields=["latitude", "longitude"],
+                condition=models.Q(active=True),
+                name="studycenter_active_geo_idx",
+            ),
+        ]
 
 
 class CustomUser(AbstractUser):
@@ -87,10 +160,102 @@ class Course(models.Model):
     name = models.CharField(max_length=255, null=False, blank=False)
     type = models.CharField(max_length=10, choices=PROJECT_CHOICES, default="oddiy")
     image = models.ImageField(upload_to="courses", null=False, blank=False)
+    # Small rendition of image for list views, made when image is uploaded
+    thumbnail = models.ImageField(
+        upload_to="courses/thumbnails", null=True, blank=True, editable=False
+    )
     name_coordinates = models.JSONField(null=True, blank=True)
     id_coordinates = models.JSONField(null=True, blank=True)
     finished_date_coordinates = models.JSONField(null=True, blank=True)
     qr_code_coordinates = models.JSONField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Active certificates of this course, maintained by Certificate
+    certificates_count = models.PositiveIntegerField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        # Get the previous image and coordinates before saving
+        if self.pk:
+            old = (
+                Course.objects.filter(pk=self.pk)
+                .values("image", "thumbnail", *self.COORDINATE_FIELDS)
+                .first()
+            )
+        else:
+            old = None
+        old_image = old["image"] if old else None
+
+        uploaded = self.image and not self.image._committed
+        if uploaded:
+            # Coordinates sent with the upload are in its pixels; unchanged
+            # ones are already in the current master's and are kept
+            self.normalize_image(
+                [
+                    field
+                    for field in self.COORDINATE_FIELDS
+                    if old is None or getattr(self, field) != old[field]
+                ]
+            )
+
+        super().save(*args, **kwargs)
+
+        # Drop render templates compiled from the old image or coordinates
+        for name in {old_image, self.image.name}:
+            if name:
+                Certificates.invalidate_templates(self.image.storage.path(name))
+
+        # The replaced master and thumbnail are unreferenced once this commits
+        if uploaded and old:
+            stale = {old["image"], old["thumbnail"]} - {
+                self.image.name,
+                self.thumbnail.name,
+            }
+            storage = self.image.storage
+
+            def delete_stale_files():
+                for name in stale:
+                    if name:
+                        storage.delete(name)
+
+            transaction.on_commit(delete_stale_files, using=self._state.db)
+
+    COORDINATE_FIELDS = (
+        "name_coordinates",
+        "id_coordinates",
+        "finished_date_coordinates",
+        "qr_code_coordinates",
+    )
+
+    def normalize_image(self, coordinate_fields=COORDINATE_FIELDS):
+        """
+        Replace a newly uploaded image with its render master and make its
+        thumbnail. coordinate_fields are taken to be in the uploaded image's
+        pixels and are scaled along with it.
+        """
+        master, thumbnail, scale = normalize_course_image(self.image)
+        self.image.save(master.name, master, save=False)
+        self.thumbnail.save(thumbnail.name, thumbnail, save=False)
+        if scale != 1:
+            for field in coordinate_fields:
+                setattr(self, field, scale_coordinates(getattr(self, field), scale))
+
+    def get_render_layout(self):
+        """
+        Background path and text/QR positions shared by every certificate of
+        this course. Missing coordinates yield empty slots the renderer skips.
+        """
+
+        def slot(coordinates):
+            if not coordinates:
+                return {}
+            return {k: coordinates[k] for k in ("x", "y", "size") if k in coordinates}
+
+        return {
+            "bg_image_path": self.image.path if self.image else "",
+            "name": slot(self.name_coordinates),
+            "id": slot(self.id_coordinates),
+            "finished_date": slot(self.finished_date_coordinates),
+            "qrcode": slot(self.qr_code_coordinates),
+        }
 
     def __str__(self):
         return self.name
@@ -119,18 +284,57 @@ class CertificatesSet(models.Model):
         max_length=10,
         default="draft",
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Active certificates in this set, maintained by Certificate
+    certificates_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
 
+    def get_certificates_data(self):
+        """
+        Build the payload consumed by Certificates.generate_many_certificates.
+        Runs a single query however many certificates the set has.
+        """
+        layouts = {}
+        certificates = []
+        # The related manager attaches self as each certificate's set
+        for certificate in self.certificates.filter(active=True).select_related(
+            "course"
+        ):
+            course = certificate.course
+            if course is None:
+                continue  # Nothing to render on
+            if course.pk not in layouts:
+                layouts[course.pk] = course.get_render_layout()
+            certificates.append(certificate.get_render_data(layouts[course.pk]))
+
+        return {"zip_name": self.name, "certificates": certificates}
+
     class Meta:
         verbose_name = "Certificates set"
         verbose_name_plural = "Certificates sets"
+        # Lists only read active rows; partial indexes match Django's bare
+        # "WHERE active" and stay small as sets are archived
+        indexes = [
+            # Managers' set lists: study_center, optionally status__in
+            models.Index(
+                fields=["study_center", "status"],
+                condition=models.Q(active=True),
+                name="certset_active_center_idx",
+            ),
+            # Staff set lists filtered by displayStatus across all centers
+            models.Index(
+                fields=["status"],
+                condition=models.Q(active=True),
+                name="certset_active_status_idx",
+            ),
+        ]
 
 
 class Certificate(models.Model):
     UUID = models.CharField(
-        max_length=7, unique=True, default=generate_short_uuid, editable=False
+        max_length=12, unique=True, default=generate_short_uuid, editable=False
     )
     active = models.BooleanField(default=True)
     name = models.CharField(max_length=255)
@@ -147,10 +351,206 @@ class Certificate(models.Model):
         null=True,
         blank=True,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # The fields deciding which certificates_count columns a row adds to
+    COUNTER_FIELDS = ("active", "certificates_set_id", "course_id")
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counted = instance._get_counter_values()
+        return instance
+
+    def _get_counter_values(self):
+        # None when one of them is deferred
+        try:
+            return tuple(self.__dict__[name] for name in self.COUNTER_FIELDS)
+        except KeyError:
+            return None
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            old = None
+            if not self._state.adding:
+                old = getattr(self, "_counted", None)
+                if old is None:
+                    old = (
+                        Certificate.objects.filter(pk=self.pk)
+                        .values_list(*self.COUNTER_FIELDS)
+                        .first()
+                    )
+
+            super().save(*args, **kwargs)
+
+            new = self._get_counter_values()
+            set_deltas, course_deltas = Counter(), Counter()
+            for values, delta in ((old, -1), (new, 1)):
+                if values and values[0]:
+                    set_deltas[values[1]] += delta
+                    course_deltas[values[2]] += delta
+            adjust_certificate_counts(set_deltas, course_deltas)
+        self._counted = new
+
+    def get_render_data(self, layout=None):
+        """
+        Render payload for this certificate, or None when it has no course.
+        Pass the course's layout when building many payloads at once.
+        """
+        if self.course_id is None:
+            return None
+        if layout is None:
+            layout = self.course.get_render_layout()
+
+        data = {
+            "bg_image_path": layout["bg_image_path"],
+            "name": self.name,
+            "texts": [
+                {"content": self.name, **layout["name"]},
+                {"content": self.UUID, **layout["id"]},
+                {
+                    "content": self.certificates_set.finished_date.strftime(
+                        "%d.%m.%Y"
+                    ),
+                    **layout["finished_date"],
+                },
+            ],
+        }
+        if layout["qrcode"]:
+            data["qrcode"] = {
+                "url": f"{settings.FRONTEND_URL}/certificate/{self.UUID}",
+                **layout["qrcode"],
+            }
+        return data
+
+    def get_render_version(self):
+        """
+        (etag, last_modified) for the rendered image. Requires course and
+        certificates_set to be loaded.
+        """
+        parts = [
+            self.pk,
+            self.updated_at,
+            self.certificates_set.updated_at,
+            self.course_id,
+            self.course.updated_at if self.course else None,
+            self.course.image.name if self.course else None,
+        ]
+        etag = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+        last_modified = max(
+            timestamp
+            for timestamp in (
+                self.updated_at,
+                self.certificates_set.updated_at,
+                self.course.updated_at if self.course else None,
+            )
+            if timestamp
+        )
+        return etag, last_modified
+
     class Meta:
         verbose_name = "Sertifikat"
         verbose_name_plural = "Sertifikatlar"
+        # Partial on active, like CertificatesSet's list indexes
+        indexes = [
+            # A set's certificates (archives, ?certificates_set= lists)
+            models.Index(
+                fields=["certificates_set"],
+                condition=models.Q(active=True),
+                name="certificate_active_set_idx",
+            ),
+            models.Index(
+                fields=["course"],
+                condition=models.Q(active=True),
+                name="certificate_active_course_idx",
+            ),
+            models.Index(
+                fields=["name"],
+                condition=models.Q(active=True),
+                name="certificate_active_name_idx",
+            ),
+        ]
+
+
+def adjust_certificate_counts(set_deltas, course_deltas, using=None):
+    """
+    Add {pk: delta} changes to the sets' and courses' certificates_count.
+    """
+    for model, deltas in ((CertificatesSet, set_deltas), (Course, course_deltas)):
+        for pk, delta in deltas.items():
+            if pk is not None and delta:
+                model.objects.using(using).filter(pk=pk).update(
+                    certificates_count=F("certificates_count") + delta
+                )
+
+
+def recount_certificates(set_ids=(), course_ids=(), using=None):
+    """
+    Recompute certificates_count from the certificates table, for bulk
+    changes that are easier to recount than to track.
+    """
+    for model, field, ids in (
+        (CertificatesSet, "certificates_set", set_ids),
+        (Course, "course", course_ids),
+    ):
+        ids = [pk for pk in ids if pk is not None]
+        if not ids:
+            continue
+        count = (
+            Certificate.objects.filter(active=True, **{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        model.objects.using(using).filter(pk__in=ids).update(
+            certificates_count=Coalesce(Subquery(count), 0)
+        )
+
+
+class CertificateRenderJob(models.Model):
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+        ("canceled", "Canceled"),
+    ]
+    ACTIVE_STATUSES = ("queued", "running")
+
+    certificates_set = models.ForeignKey(
+        CertificatesSet, related_name="render_jobs", on_delete=models.CASCADE
+    )
+    created_by = models.ForeignKey(
+        "CustomUser",
+        related_name="render_jobs",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    status = models.CharField(choices=STATUS_CHOICES, max_length=10, default="queued")
+    options = models.JSONField(default=dict, blank=True)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    result = models.FileField(upload_to="certificate_zips", null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Bumped with each progress update; stale running jobs are reclaimed
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.certificates_set} ({self.status})"
+
+    @property
+    def output_options(self):
+        return Certificates.get_output_options(**self.options)
+
+    class Meta:
+        ordering = ("-created_at",)
+        verbose_name = "Certificate render job"
+        verbose_name_plural = "Certificate render jobs"
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import tempfile
+from django.conf import settings
+from .cerificate_generator import base_dir
+
+# Bump when the renderer's output changes so old entries stop matching
+RENDER_CACHE_VERSION = 1
+
+
+class RenderCache:
+    """
+    Content-addressed store of rendered certificate images on local disk.
+
+    Entries are named by a hash of everything that affects the output, so a
+    changed name, date, layout or course image simply misses. Hits refresh
+    the file mtime, which prune() uses as the LRU order.
+    """
+
+    def __init__(self, directory, max_bytes, prune_interval=100):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self._writes = 0
+
+    def key_for(self, certificate, options=None):
+        try:
+            stat = os.stat(os.path.join(base_dir, certificate["bg_image_path"]))
+        except (KeyError, OSError):
+            return None  # Not renderable, nothing to cache
+
+        inputs = {
+            "version": RENDER_CACHE_VERSION,
+            "certificate": certificate,
+            "bg_image": [stat.st_mtime_ns, stat.st_size],
+            "options": options or {},
+        }
+        encoded = json.dumps(inputs, sort_keys=True, default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return content
+
+    def set(self, key, content):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+        self._writes += 1
+        if self._writes % self.prune_interval == 0:
+            self.prune()
+
+    def prune(self, max_bytes=None):
+        """
+        Delete least recently used entries until the cache fits in max_bytes.
+        Returns (files_removed, bytes_freed).
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        removed = freed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total - freed <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += size
+        return removed, freed
+
+
+# One instance per directory and process, so writes from every request
+# count towards the prune interval
+_render_caches = {}
+
+
+def get_render_cache():
+    """
+    The configured RenderCache, or None when CERTIFICATE_RENDER_CACHE_DIR is empty.
+    """
+    directory = getattr(settings, "CERTIFICATE_RENDER_CACHE_DIR", None)
+    if not directory:
+        return None
+    max_bytes = settings.CERTIFICATE_RENDER_CACHE_MAX_BYTES
+    key = (str(directory), max_bytes)
+    if key not in _render_caches:
+        _render_caches[key] = RenderCache(directory, max_bytes)
+    return _render_caches[key]
@@ -0,0 +1,197 @@
+import datetime
+import tempfile
+import time
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import CertificateRenderJob
+from .cerificate_generator import Certificates
+from .render_cache import get_render_cache
+
+
+class RenderJobCanceled(Exception):
+    pass
+
+
+def enqueue_render_job(certificates_set, user=None, options=None):
+    """
+    Queue an archive render job for the set, reusing an unfinished one with
+    the same output options if present.
+    """
+    options = options or Certificates.get_output_options()
+    with transaction.atomic():
+        job = certificates_set.render_jobs.filter(
+            status__in=CertificateRenderJob.ACTIVE_STATUSES, options=options
+        ).first()
+        if job:
+            return job, False
+
+        job = CertificateRenderJob.objects.create(
+            certificates_set=certificates_set,
+            created_by=user if user and user.is_authenticated else None,
+            options=options,
+            total=certificates_set.certificates.filter(active=True).count(),
+        )
+        certificates_set.status = "pending"
+        certificates_set.save(update_fields=["status"])
+    return job, True
+
+
+def settle_set_status(certificates_set, status):
+    """
+    Save the status a finished job leaves on its set. Jobs with other output
+    options may still be queued or running, and then the set stays pending.
+    """
+    if certificates_set.render_jobs.filter(
+        status__in=CertificateRenderJob.ACTIVE_STATUSES
+    ).exists():
+        status = "pending"
+    certificates_set.status = status
+    certificates_set.save(update_fields=["status"])
+
+
+def cancel_render_job(job):
+    """
+    Cancel a queued or running job. A running worker notices on its next
+    progress update and stops rendering.
+    """
+    with transaction.atomic():
+        updated = CertificateRenderJob.objects.filter(
+            pk=job.pk, status__in=CertificateRenderJob.ACTIVE_STATUSES
+        ).update(
+            status="canceled", finished_at=timezone.now(), updated_at=timezone.now()
+        )
+        if updated:
+            settle_set_status(job.certificates_set, "canceled")
+    job.refresh_from_db()
+    return bool(updated)
+
+
+def archive_extension(options):
+    return "pdf" if options["format"] == "pdf" else "zip"
+
+
+def archive_content_type(options):
+    return "application/pdf" if options["format"] == "pdf" else "application/zip"
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest queued job to running and return it. Running
+    jobs without a progress update for RENDER_JOB_STALE_TIMEOUT seconds
+    belong to a worker that died and are claimed again.
+    """
+    stale_before = timezone.now() - datetime.timedelta(
+        seconds=settings.RENDER_JOB_STALE_TIMEOUT
+    )
+    while True:
+        job = (
+            CertificateRenderJob.objects.filter(
+                Q(status="queued") | Q(status="running", updated_at__lt=stale_before)
+            )
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+
+        # Only one worker wins the conditional update. A new started_at also
+        # stops a stale worker that comes back: its updates no longer match.
+        now = timezone.now()
+        claimed = CertificateRenderJob.objects.filter(
+            pk=job.pk, status=job.status, started_at=job.started_at
+        ).update(status="running", processed=0, started_at=now, updated_at=now)
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_job(job, progress_interval=1.0):
+    certificates_set = job.certificates_set
+    last_update = 0
+    archive = None
+
+    # Matches only while this worker still owns the job: not canceled and
+    # not reclaimed by another worker after a stall
+    owned = CertificateRenderJob.objects.filter(
+        pk=job.pk, status="running", started_at=job.started_at
+    )
+
+    def report_progress(processed):
+        nonlocal last_update
+        now = time.monotonic()
+        if now - last_update < progress_interval and processed < job.total:
+            return
+        last_update = now
+        if not owned.update(processed=processed, updated_at=timezone.now()):
+            raise RenderJobCanceled()
+
+    options = job.output_options
+    try:
+        data = certificates_set.get_certificates_data()
+        job.total = len(data["certificates"])
+        owned.update(total=job.total, updated_at=timezone.now())
+        archive = tempfile.TemporaryFile()
+        for chunk in Certificates.stream_many_certificates(
+            data,
+            progress_callback=report_progress,
+            cache=get_render_cache(),
+            options=options,
+        ):
+            archive.write(chunk)
+    except RenderJobCanceled:
+        archive.close()
+        job.refresh_from_db()
+        return job
+    except Exception as e:
+        if archive:
+            archive.close()
+        with transaction.atomic():
+            now = timezone.now()
+            failed = owned.update(
+                status="failed", error=str(e), finished_at=now, updated_at=now
+            )
+            if failed:
+                settle_set_status(certificates_set, "draft")
+        job.refresh_from_db()
+        return job
+
+    with archive:
+        archive.seek(0)
+        job.result.save(
+            f"{certificates_set.name}-{job.pk}.{archive_extension(options)}",
+            File(archive),
+            save=False,
+        )
+    with transaction.atomic():
+        now = timezone.now()
+        finished = owned.update(
+            status="completed",
+            result=job.result.name,
+            processed=job.total,
+            finished_at=now,
+            updated_at=now,
+        )
+        if finished:
+            settle_set_status(certificates_set, "completed")
+        else:
+            # Canceled or reclaimed while the archive was being written
+            job.result.delete(save=False)
+    job.refresh_from_db()
+    return job
+
+
+def run_worker(once=False, poll_interval=None):
+    if poll_interval is None:
+        poll_interval = settings.RENDER_JOB_POLL_INTERVAL
+
+    while True:
+        job = claim_next_job()
+        if job:
+            yield run_job(job)
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
@@ -1,13 +1,22 @@
 import datetime
 from rest_framework import serializers
-from .models import StudyCenter, Course, Certificate, CertificatesSet
+from .models import (
+    StudyCenter,
+    Course,
+    Certificate,
+    CertificatesSet,
+    CertificateRenderJob,
+)
 from django.contrib.auth import get_user_model
+from django.urls import reverse
+from .cerificate_generator import Certificates
+from .mixins import DynamicFieldsMixin
 import re
 
 User = get_user_model()
 
 
-class StudyCenterSerializer(serializers.ModelSerializer):
+class StudyCenterSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = StudyCenter
         fields = (
@@ -90,17 +99,11 @@ class StudyCenterSerializer(serializers.ModelSerializer):
 
         return super().update(instance, validated_data)
 
-    def __init__(self, *args, **kwargs):
-        super(StudyCenterSerializer, self).__init__(*args, **kwargs)
-        request = self.context.get("request", None)
+    def get_expandable_fields(self):
+        return {"manager": ("displayManager", UserSerializer)}
 
-        if request and request.method == "GET":
-            manager = request.GET.get("displayManager", None) == "true"
-            if manager:
-                self.fields["manager"] = UserSerializer(context=self.context)
 
-
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = (
@@ -153,13 +156,14 @@ class UserSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Course
         fields = (
             "id",
             "name",
             "image",
+            "thumbnail",
             "type",
             "name_coordinates",
             "id_coordinates",
@@ -180,7 +184,7 @@ class CourseSerializer(serializers.ModelSerializer):
         return value
 
 
-class CertificatesSetSerializer(serializers.ModelSerializer):
+class CertificatesSetSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = CertificatesSet
         fields = (
@@ -189,9 +193,10 @@ class CertificatesSetSerializer(serializers.ModelSerializer):
             "study_center",
             "finished_date",
             "status",
+            "certificates_count",
         )
 
-        read_only_fields = ("study_center",)
+        read_only_fields = ("study_center", "certificates_count")
 
     def validate_name(self, value):
         if not value.strip():
@@ -227,19 +232,11 @@ class CertificatesSetSerializer(serializers.ModelSerializer):
         validated_data["study_center"] = user_study_center
         return super().create(validated_data)
 
-    def __init__(self, *args, **kwargs):
-        super(CertificatesSetSerializer, self).__init__(*args, **kwargs)
-
-        request = self.context.get("request", None)
-        if request and hasattr(request, "method") and request.method == "GET":
-            study_center = request.GET.get("displayStudyCenter", None)
-            if study_center:
-                self.fields["study_center"] = StudyCenterSerializer(
-                    context=self.context
-                )
+    def get_expandable_fields(self):
+        return {"study_center": ("displayStudyCenter", StudyCenterSerializer)}
 
 
-class CertificateSerializer(serializers.ModelSerializer):
+class CertificateSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Certificate
         fields = (
@@ -265,11 +262,150 @@ class CertificateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Phone number must be exactly 12 digits.")
         return value
 
-    def __init__(self, *args, **kwargs):
-        super(CertificateSerializer, self).__init__(*args, **kwargs)
-        request = self.context.get("request", None)
+    def get_expandable_fields(self):
+        return {"course": ("displayCourse", CourseSerializer)}
+
+
+class CertificateImportRowSerializer(CertificateSerializer):
+    """
+    One row of a bulk import. Shares CertificateSerializer's validation but
+    checks courses against ids preloaded into context["course_ids"] instead
+    of querying per row.
+    """
+
+    course = serializers.IntegerField(
+        source="course_id", required=False, allow_null=True
+    )
+
+    class Meta(CertificateSerializer.Meta):
+        fields = (
+            "name",
+            "social_status",
+            "birthdate",
+            "contact_number",
+            "course",
+        )
+
+    def validate_course(self, value):
+        if value is not None and value not in self.context["course_ids"]:
+            raise serializers.ValidationError(
+                f'Invalid pk "{value}" - object does not exist.'
+            )
+        return value
+
+
+class CertificateBulkSerializer(serializers.Serializer):
+    """
+    Selects certificates for a bulk operation by primary keys or by the
+    same filters the certificates list endpoint accepts.
+    """
 
-        if request and request.method == "GET":
-            course = request.GET.get("displayCourse", None) == "true"
-            if course:
-                self.fields["course"] = CourseSerializer(context=self.context)
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False
+    )
+    filter = serializers.DictField(required=False, allow_empty=False)
+
+    def validate(self, attrs):
+        if ("ids" in attrs) == ("filter" in attrs):
+            raise serializers.ValidationError("Provide either 'ids' or 'filter'.")
+        return attrs
+
+
+class CertificateBulkUpdateSerializer(CertificateBulkSerializer):
+    patch = serializers.DictField(allow_empty=False)
+
+    def validate_patch(self, value):
+        writable = set(CertificateSerializer.Meta.fields) - set(
+            CertificateSerializer.Meta.read_only_fields
+        )
+        unknown = set(value) - writable
+        if unknown:
+            raise serializers.ValidationError(
+                f"Fields cannot be bulk updated: {', '.join(sorted(unknown))}."
+            )
+
+        serializer = CertificateSerializer(data=value, partial=True)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+
+class CertificateRenderJobSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CertificateRenderJob
+        fields = (
+            "id",
+            "certificates_set",
+            "status",
+            "total",
+            "processed",
+            "progress",
+            "error",
+            "download_url",
+            "created_at",
+            "started_at",
+            "finished_at",
+        )
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        if obj.status == "completed":
+            return 100
+        if not obj.total:
+            return 0
+        return min(100, obj.processed * 100 // obj.total)
+
+    def get_download_url(self, obj):
+        if obj.status != "completed" or not obj.result:
+            return None
+        url = reverse("render-jobs-download", kwargs={"pk": obj.pk})
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+
+class ArchiveOptionsSerializer(serializers.Serializer):
+    # "format" itself is DRF's renderer override parameter
+    output_format = serializers.ChoiceField(
+        choices=["png", "jpeg", "webp", "pdf"], default="png", source="format"
+    )
+    quality = serializers.IntegerField(min_value=1, max_value=100, required=False)
+    compress_level = serializers.IntegerField(
+        min_value=0, max_value=9, required=False
+    )
+    compression = serializers.ChoiceField(
+        choices=["stored", "deflated"], required=False
+    )
+
+    def to_internal_value(self, data):
+        validated = super().to_internal_value(data)
+        return Certificates.get_output_options(**validated)
+
+
+class ImageOptionsSerializer(ArchiveOptionsSerializer):
+    output_format = serializers.ChoiceField(
+        choices=["png", "jpeg", "webp"], default="png", source="format"
+    )
+    # Public endpoint: encoder settings stay at the format defaults
+    quality = None
+    compress_level = None
+    compression = None
+
+
+NEARBY_MAX_RESULTS = 100
+
+
+class NearbySearchSerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    radius_km = serializers.FloatField(min_value=0, required=False)
+    k = serializers.IntegerField(
+        min_value=1, max_value=NEARBY_MAX_RESULTS, required=False
+    )
+
+    def validate(self, attrs):
+        # A radius alone returns everything in it, up to the k limit
+        if "k" not in attrs:
+            attrs["k"] = NEARBY_MAX_RESULTS if "radius_km" in attrs else 10
+        return attrs
@@ -0,0 +1,97 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .models import (
+    StudyCenter,
+    Course,
+    Certificate,
+    CertificatesSet,
+    CustomUser,
+    recount_certificates,
+)
+from .caching import (
+    invalidate_certificate_lookups,
+    invalidate_cached_users,
+    bump_response_version,
+)
+
+
+# Cached certificate_by_uuid responses embed the set, course and study center
+@receiver([post_save, post_delete], sender=Certificate)
+def certificate_changed(sender, instance, **kwargs):
+    invalidate_certificate_lookups([instance.UUID])
+
+
+@receiver([post_save, post_delete], sender=CertificatesSet)
+def certificates_set_changed(sender, instance, using, **kwargs):
+    invalidate_certificate_lookups(
+        Certificate.objects.using(using)
+        .filter(certificates_set=instance)
+        .values_list("UUID", flat=True)
+    )
+
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, instance, using, **kwargs):
+    invalidate_certificate_lookups(
+        Certificate.objects.using(using)
+        .filter(course=instance)
+        .values_list("UUID", flat=True)
+    )
+
+
+@receiver([post_save, post_delete], sender=StudyCenter)
+def study_center_changed(sender, instance, using, **kwargs):
+    invalidate_certificate_lookups(
+        Certificate.objects.using(using)
+        .filter(certificates_set__study_center=instance)
+        .values_list("UUID", flat=True)
+    )
+
+
+# Users cached by CachedJWTAuthentication carry their study center
+@receiver([post_save, post_delete], sender=CustomUser)
+def user_changed(sender, instance, **kwargs):
+    invalidate_cached_users([instance.pk])
+
+
+# pre_delete: deleting a center nulls its users' study_center without signals
+@receiver([post_save, pre_delete], sender=StudyCenter)
+def study_center_users_changed(sender, instance, using, **kwargs):
+    invalidate_cached_users(
+        [
+            instance.manager_id,
+            *CustomUser.objects.using(using)
+            .filter(study_center=instance)
+            .values_list("pk", flat=True),
+        ]
+    )
+
+
+# Versioned course and study center responses
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=StudyCenter)
+@receiver([post_save, post_delete], sender=CustomUser)
+def response_model_changed(sender, **kwargs):
+    bump_response_version(sender)
+
+
+# Sets and courses losing active certificates, per delete() call. The
+# collector sends every pre_delete before deleting anything and removes all
+# certificates in one batch before the first post_delete, so one recount per
+# call covers cascades and queryset deletes instead of two UPDATEs per row.
+_pending_recounts = {}
+
+
+@receiver(pre_delete, sender=Certificate)
+def certificate_deleting(sender, instance, origin=None, **kwargs):
+    if instance.active:
+        set_ids, course_ids = _pending_recounts.setdefault(id(origin), (set(), set()))
+        set_ids.add(instance.certificates_set_id)
+        course_ids.add(instance.course_id)
+
+
+@receiver(post_delete, sender=Certificate)
+def certificate_deleted(sender, instance, using, origin=None, **kwargs):
+    pending = _pending_recounts.pop(id(origin), None)
+    if pending:
+        recount_certificates(*pending, using=using)
@@ -1,3 +1,1607 @@
-from django.test import TestCase
+import contextlib
+import datetime
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+from unittest import mock
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from PIL import Image
+from . import cerificate_generator, views
+from .cerificate_generator import Certificates, get_render_pool, shutdown_render_pool
+from .importers import import_certificates
+from .models import (
+    StudyCenter,
+    Course,
+    Certificate,
+    CertificatesSet,
+    CertificateRenderJob,
+    CustomUser,
+    allocate_certificate_ids,
+    format_certificate_id,
+    recount_certificates,
+)
+from .render_cache import RenderCache, get_render_cache
+from .render_jobs import claim_next_job, run_job, enqueue_render_job, cancel_render_job
 
-# Create your tests here.
+
+def create_course(name="Course", **kwargs):
+    coordinates = {"x": 100, "y": 100, "size": 20}
+    defaults = {
+        "image": f"courses/{name}.png",
+        "name_coordinates": coordinates,
+        "id_coordinates": coordinates,
+        "finished_date_coordinates": coordinates,
+        "qr_code_coordinates": coordinates,
+    }
+    defaults.update(kwargs)
+    return Course.objects.create(name=name, **defaults)
+
+
+def create_study_center(name="Center", **kwargs):
+    defaults = {
+        "location": "https://maps.google.com/@41.3,69.2",
+        "latitude": 41.3,
+        "longitude": 69.2,
+    }
+    defaults.update(kwargs)
+    return StudyCenter.objects.create(name=name, **defaults)
+
+
+def create_certificates_set(study_center, name="Set", **kwargs):
+    return CertificatesSet.objects.create(
+        name=name,
+        study_center=study_center,
+        finished_date=datetime.date(2025, 1, 1),
+        **kwargs,
+    )
+
+
+def use_temp_media(test_case, **settings):
+    """
+    Point MEDIA_ROOT at a temporary directory for the test, with the disk
+    render cache off unless settings turn it on.
+    """
+    media_root = tempfile.TemporaryDirectory()
+    test_case.addCleanup(media_root.cleanup)
+    settings_override = test_case.settings(
+        MEDIA_ROOT=media_root.name,
+        **{"CERTIFICATE_RENDER_CACHE_DIR": "", **settings},
+    )
+    settings_override.enable()
+    test_case.addCleanup(settings_override.disable)
+    return media_root.name
+
+
+def write_background(course, size=(400, 300), color="white"):
+    # Course images are stored paths; this writes the file behind one
+    path = course.image.path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new("RGB", size, color).save(path)
+    return path
+
+
+class CertificatesSetRenderDataTests(TestCase):
+    def setUp(self):
+        self.courses = [create_course("First"), create_course("Second")]
+        self.certificates_set = create_certificates_set(create_study_center())
+
+    def add_certificates(self, count):
+        for i in range(count):
+            Certificate.objects.create(
+                name=f"Student {i}",
+                certificates_set=self.certificates_set,
+                course=self.courses[i % 2],
+            )
+
+    def get_query_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.certificates_set.get_certificates_data()
+        return len(queries), data
+
+    def test_query_count_is_constant(self):
+        self.add_certificates(2)
+        small_count, _ = self.get_query_count()
+        self.add_certificates(20)
+        large_count, data = self.get_query_count()
+
+        self.assertEqual(small_count, 1)
+        self.assertEqual(large_count, small_count)
+        self.assertEqual(len(data["certificates"]), 22)
+
+    def test_each_certificate_uses_its_own_course(self):
+        self.add_certificates(2)
+        _, data = self.get_query_count()
+
+        paths = [certificate["bg_image_path"] for certificate in data["certificates"]]
+        self.assertTrue(paths[0].endswith("First.png"))
+        self.assertTrue(paths[1].endswith("Second.png"))
+
+
+class CertificateIdAllocatorTests(TestCase):
+    def test_blocks_are_unique_and_continue(self):
+        first = allocate_certificate_ids(500)
+        second = allocate_certificate_ids(500)
+
+        self.assertEqual(len(set(first + second)), 1000)
+        for certificate_id in first + second:
+            self.assertRegex(certificate_id, r"^ID\d{6}$")
+
+    def test_mapping_is_one_to_one_across_digit_lengths(self):
+        # Last 6-digit IDs and first 7-digit IDs
+        numbers = list(range(900000 - 1000, 900000 + 1000))
+        ids = [format_certificate_id(number) for number in numbers]
+
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(len(ids[999]), 8)
+        self.assertEqual(len(ids[1000]), 9)
+
+    def test_created_certificates_get_allocated_ids(self):
+        certificates_set = create_certificates_set(create_study_center())
+        certificates = [
+            Certificate.objects.create(name=str(i), certificates_set=certificates_set)
+            for i in range(3)
+        ]
+
+        self.assertEqual(len({certificate.UUID for certificate in certificates}), 3)
+
+
+class CertificateImportTests(TestCase):
+    def setUp(self):
+        self.course = create_course()
+        self.certificates_set = create_certificates_set(create_study_center())
+
+    def test_csv_rows_are_validated_and_bulk_inserted(self):
+        upload = SimpleUploadedFile(
+            "students.csv",
+            (
+                "name,birthdate,contact_number,course\n"
+                f"Alice,2001-02-03,998901234567,{self.course.pk}\n"
+                "Bob,,,\n"
+                ",2001-02-03,123,999\n"
+            ).encode(),
+        )
+
+        result = import_certificates(self.certificates_set, upload, batch_size=1)
+
+        self.assertEqual(result["created"], 2)
+        self.assertEqual(result["failed"], 1)
+        self.assertEqual(result["errors"][0]["row"], 4)
+        self.assertEqual(
+            set(result["errors"][0]["errors"]), {"name", "contact_number", "course"}
+        )
+        alice = self.certificates_set.certificates.get(name="Alice")
+        self.assertEqual(alice.course, self.course)
+        self.assertEqual(alice.birthdate, datetime.date(2001, 2, 3))
+
+
+@skipUnlessDBFeature("supports_partial_indexes")
+class ListQueryPlanTests(TestCase):
+    """
+    Each list endpoint's main query must be answered from an index, not a
+    full table scan. Lists without a selective filter page through the
+    primary key range of IdCursorPagination.
+    """
+
+    def setUp(self):
+        caches["responses"].clear()
+        self.study_center = create_study_center()
+        create_study_center("Other")
+        self.course = create_course()
+        create_course()
+        self.certificates_set = create_certificates_set(self.study_center)
+        Certificate.objects.create(
+            name="Student", certificates_set=self.certificates_set, course=self.course
+        )
+        for _ in range(2):
+            CertificateRenderJob.objects.create(
+                certificates_set=self.certificates_set, options={}
+            )
+        self.staff = CustomUser.objects.create(username="staff", is_staff=True)
+        self.manager = CustomUser.objects.create(
+            username="manager", study_center=self.study_center
+        )
+        self.client = APIClient()
+
+    def get_query_plan(self, user, path, table):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+
+        sql = next(
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith("SELECT") and f'FROM "{table}"' in query["sql"]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return " | ".join(str(row[-1]) for row in cursor.fetchall())
+
+    def get_next_page_query_plan(self, user, path, table):
+        self.client.force_authenticate(user)
+        separator = "&" if "?" in path else "?"
+        response = self.client.get(f"{path}{separator}page_size=1")
+        return self.get_query_plan(user, response.json()["next"], table)
+
+    def assertUsesIndex(self, plan, index_name):
+        self.assertIn(f"INDEX {index_name}", plan)
+
+    def assertPrimaryKeyRange(self, plan):
+        self.assertIn("USING INTEGER PRIMARY KEY (rowid<?)", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_certificates_by_set(self):
+        plan = self.get_query_plan(
+            self.staff,
+            f"/api/certificates/?certificates_set={self.certificates_set.pk}",
+            "app_certificate",
+        )
+        self.assertUsesIndex(plan, "certificate_active_set_idx")
+
+    def test_certificates_by_course(self):
+        plan = self.get_query_plan(
+            self.staff, f"/api/certificates/?course={self.course.pk}", "app_certificate"
+        )
+        self.assertUsesIndex(plan, "certificate_active_course_idx")
+
+    def test_certificates_by_name(self):
+        plan = self.get_query_plan(
+            self.staff, "/api/certificates/?name=Student", "app_certificate"
+        )
+        self.assertUsesIndex(plan, "certificate_active_name_idx")
+
+    def test_nearby_study_centers(self):
+        plan = self.get_query_plan(
+            self.staff,
+            "/api/study-centers/nearby/?latitude=41.3&longitude=69.2&k=1",
+            "app_studycenter",
+        )
+        self.assertUsesIndex(plan, "studycenter_active_geo_idx")
+
+    def test_manager_certificate_sets(self):
+        plan = self.get_query_plan(
+            self.manager,
+            "/api/certificate-sets/?displayStatus=pending",
+            "app_certificatesset",
+        )
+        self.assertUsesIndex(plan, "certset_active_center_idx")
+
+    def test_staff_certificate_sets_by_status(self):
+        plan = self.get_query_plan(
+            self.staff,
+            "/api/certificate-sets/?displayStatus=pending",
+            "app_certificatesset",
+        )
+        self.assertUsesIndex(plan, "certset_active_status_idx")
+
+    def test_courses(self):
+        plan = self.get_next_page_query_plan(self.staff, "/api/courses/", "app_course")
+        self.assertPrimaryKeyRange(plan)
+
+    def test_study_centers(self):
+        plan = self.get_next_page_query_plan(
+            self.staff, "/api/study-centers/", "app_studycenter"
+        )
+        self.assertPrimaryKeyRange(plan)
+
+    def test_users(self):
+        CustomUser.objects.create(username="other manager")
+        for path in ("/api/users/", "/api/users/?is_manager=true"):
+            plan = self.get_next_page_query_plan(self.staff, path, "app_customuser")
+            self.assertPrimaryKeyRange(plan)
+
+    def test_staff_render_jobs(self):
+        for path in ("/api/render-jobs/", "/api/render-jobs/?status=queued"):
+            plan = self.get_next_page_query_plan(
+                self.staff, path, "app_certificaterenderjob"
+            )
+            self.assertPrimaryKeyRange(plan)
+
+    def test_manager_render_jobs(self):
+        plan = self.get_query_plan(
+            self.manager, "/api/render-jobs/", "app_certificaterenderjob"
+        )
+        self.assertIn("app_certificaterenderjob USING INDEX", plan)
+        self.assertIn("(certificates_set_id=?)", plan)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.study_center = create_study_center()
+        self.course = create_course()
+        self.certificates_set = create_certificates_set(self.study_center)
+        Certificate.objects.create(
+            name="Student", certificates_set=self.certificates_set, course=self.course
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomUser.objects.create(username="staff", is_staff=True)
+        )
+
+    def get(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        sql = next(
+            query["sql"]
+            for query in queries
+            if 'FROM "app_certificate"' in query["sql"]
+        )
+        return response.json()["results"], sql
+
+    def test_fields_trims_output_and_columns(self):
+        results, sql = self.get("/api/certificates/?fields=id,name")
+        self.assertEqual(results, [{"id": results[0]["id"], "name": "Student"}])
+        self.assertNotIn('"contact_number"', sql)
+        self.assertNotIn('"birthdate"', sql)
+
+    def test_omit_removes_fields(self):
+        results, sql = self.get("/api/certificates/?omit=contact_number,birthdate")
+        self.assertNotIn("contact_number", results[0])
+        self.assertIn("course", results[0])
+        self.assertNotIn('"contact_number"', sql)
+
+    def test_expansion_respects_fields(self):
+        results, _ = self.get("/api/certificates/?fields=id,course&displayCourse=true")
+        self.assertEqual(results[0]["course"]["name"], "Course")
+        self.assertEqual(set(results[0]), {"id", "course"})
+
+
+class ExpansionQueryCountTests(TestCase):
+    """
+    display* expansions are fetched with the list query, so a page costs
+    the same number of queries whatever it expands.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomUser.objects.create(username="staff", is_staff=True)
+        )
+        course = create_course()
+        for i in range(5):
+            manager = CustomUser.objects.create(username=f"manager{i}")
+            study_center = create_study_center(f"Center {i}", manager=manager)
+            certificates_set = create_certificates_set(study_center, f"Set {i}")
+            Certificate.objects.create(
+                name=f"Student {i}", certificates_set=certificates_set, course=course
+            )
+
+    def assertListQueries(self, path, expected):
+        with self.assertNumQueries(expected):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def test_certificates(self):
+        self.assertListQueries("/api/certificates/", 1)
+        results = self.assertListQueries("/api/certificates/?displayCourse=true", 1)
+        self.assertEqual(results[0]["course"]["name"], "Course")
+
+    def test_study_centers(self):
+        self.assertListQueries("/api/study-centers/", 1)
+        results = self.assertListQueries(
+            "/api/study-centers/?displayManager=true", 1
+        )
+        self.assertTrue(results[0]["manager"]["username"].startswith("manager"))
+
+    def test_certificate_sets(self):
+        self.assertListQueries("/api/certificate-sets/", 1)
+        results = self.assertListQueries(
+            "/api/certificate-sets/?displayStudyCenter=true", 1
+        )
+        self.assertIsInstance(results[0]["study_center"]["manager"], int)
+        results = self.assertListQueries(
+            "/api/certificate-sets/?displayStudyCenter=true&displayManager=true", 1
+        )
+        self.assertIn("username", results[0]["study_center"]["manager"])
+
+    def test_expansion_dropped_by_fields_is_not_joined(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/certificates/?displayCourse=true&fields=id,name")
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("app_course", queries[0]["sql"])
+
+
+@override_settings(SERVER_TIMING_ENABLED=True, SERVER_TIMING_SLOW_REQUEST_MS=0)
+class ServerTimingTests(TestCase):
+    def test_reports_db_and_serializer_time(self):
+        certificates_set = create_certificates_set(create_study_center())
+        Certificate.objects.create(name="Student", certificates_set=certificates_set)
+        client = APIClient()
+        client.force_authenticate(
+            CustomUser.objects.create(username="staff", is_staff=True)
+        )
+
+        with self.assertLogs("app.performance", "WARNING") as logs:
+            response = client.get("/api/certificates/")
+
+        server_timing = response["Server-Timing"]
+        self.assertIn('desc="1 queries"', server_timing)
+        self.assertIn("serialize;dur=", server_timing)
+        self.assertIn("total;dur=", server_timing)
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry["db_queries"], 1)
+        self.assertIn('FROM "app_certificate"', entry["queries"][0]["sql"])
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = CustomUser.objects.create(username="manager")
+        self.study_center = create_study_center(manager=self.manager)
+        create_certificates_set(self.study_center)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.manager)}"
+        )
+
+    def get_sets(self):
+        response = self.client.get("/api/certificate-sets/")
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def test_cached_user_skips_user_queries(self):
+        with self.assertNumQueries(2):
+            self.get_sets()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.get_sets()), 1)
+
+    def test_manager_reassignment_invalidates_cached_user(self):
+        self.get_sets()
+        self.study_center.manager = CustomUser.objects.create(username="other")
+        self.study_center.save()
+        self.assertEqual(self.get_sets(), [])
+
+    def test_deactivated_user_is_rejected(self):
+        self.get_sets()
+        self.manager.is_active = False
+        self.manager.save()
+        response = self.client.get("/api/certificate-sets/")
+        # SessionAuthentication comes first, so failures are reported as 403
+        self.assertEqual(response.status_code, 403)
+
+
+class VersionedResponseCacheTests(TestCase):
+    def setUp(self):
+        caches["responses"].clear()
+        self.course = create_course()
+        self.manager = CustomUser.objects.create(username="manager")
+        self.study_center = create_study_center(manager=self.manager)
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomUser.objects.create(username="staff", is_staff=True)
+        )
+
+    def get(self, path, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_list_is_cached_until_a_course_changes(self):
+        self.get("/api/courses/", 1)
+        self.get("/api/courses/", 0)
+        self.course.name = "Renamed"
+        self.course.save()
+        data = self.get("/api/courses/", 1)
+        self.assertEqual(data["results"][0]["name"], "Renamed")
+
+    def test_varies_by_display_parameters(self):
+        self.get("/api/study-centers/", 1)
+        data = self.get("/api/study-centers/?displayManager=true", 1)
+        self.assertEqual(data["results"][0]["manager"]["username"], "manager")
+        self.get(f"/api/study-centers/{self.study_center.pk}/", 1)
+        self.get(f"/api/study-centers/{self.study_center.pk}/", 0)
+
+    def test_varies_by_host_and_scheme(self):
+        self.get("/api/courses/", 1)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/courses/", HTTP_HOST="other.example")
+        image = response.json()["results"][0]["image"]
+        self.assertTrue(image.startswith("http://other.example/"))
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/courses/", secure=True)
+        image = response.json()["results"][0]["image"]
+        self.assertTrue(image.startswith("https://testserver/"))
+
+    def test_manager_reassignment_bumps_version(self):
+        self.get("/api/study-centers/?displayManager=true", 1)
+        self.study_center.manager = CustomUser.objects.create(username="other")
+        self.study_center.save()
+        data = self.get("/api/study-centers/?displayManager=true", 1)
+        self.assertEqual(data["results"][0]["manager"]["username"], "other")
+
+
+class CertificateCounterTests(TestCase):
+    def setUp(self):
+        self.study_center = create_study_center()
+        self.first_set = create_certificates_set(self.study_center, "First")
+        self.second_set = create_certificates_set(self.study_center, "Second")
+        self.course = create_course()
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomUser.objects.create(username="staff", is_staff=True)
+        )
+
+    def assertCounts(self, first_set, second_set, course):
+        for obj, expected in (
+            (self.first_set, first_set),
+            (self.second_set, second_set),
+            (self.course, course),
+        ):
+            obj.refresh_from_db(fields=["certificates_count"])
+            self.assertEqual(obj.certificates_count, expected)
+
+    def test_save_and_delete_keep_counters(self):
+        certificate = Certificate.objects.create(
+            name="A", certificates_set=self.first_set, course=self.course
+        )
+        Certificate.objects.create(name="B", certificates_set=self.first_set)
+        self.assertCounts(2, 0, 1)
+
+        certificate = Certificate.objects.get(pk=certificate.pk)
+        certificate.certificates_set = self.second_set
+        certificate.save()
+        self.assertCounts(1, 1, 1)
+
+        certificate.active = False
+        certificate.save()
+        self.assertCounts(1, 0, 0)
+
+        Certificate.objects.filter(certificates_set=self.first_set).delete()
+        self.assertCounts(0, 0, 0)
+
+    def test_cascade_delete_recounts_once(self):
+        other_course = create_course()
+        Certificate.objects.bulk_create(
+            Certificate(name=str(i), certificates_set=self.first_set, course=course)
+            for i, course in enumerate([self.course] * 5 + [other_course] * 5)
+        )
+        recount_certificates([self.first_set.pk], [self.course.pk])
+        with CaptureQueriesContext(connection) as queries:
+            self.course.delete()
+        counter_updates = [
+            query["sql"]
+            for query in queries.captured_queries
+            if "certificates_count" in query["sql"]
+        ]
+        self.assertEqual(len(counter_updates), 2)
+        self.first_set.refresh_from_db(fields=["certificates_count"])
+        self.assertEqual(self.first_set.certificates_count, 5)
+
+    def test_bulk_paths_keep_counters(self):
+        upload = SimpleUploadedFile(
+            "students.csv", f"name,course\nA,{self.course.pk}\nB,\n".encode()
+        )
+        import_certificates(self.first_set, upload)
+        self.assertCounts(2, 0, 1)
+
+        ids = list(self.first_set.certificates.values_list("id", flat=True))
+        self.client.post(
+            "/api/certificates/bulk_update/",
+            {"ids": ids, "patch": {"certificates_set": self.second_set.pk}},
+            format="json",
+        )
+        self.assertCounts(0, 2, 1)
+
+        self.client.post(
+            "/api/certificates/bulk_delete/", {"ids": ids[:1]}, format="json"
+        )
+        self.assertCounts(0, 1, 0)
+
+    def test_statistics(self):
+        Certificate.objects.create(
+            name="A", certificates_set=self.first_set, course=self.course
+        )
+        Certificate.objects.create(name="B", certificates_set=self.second_set)
+        archived = create_certificates_set(self.study_center, "Archived")
+        Certificate.objects.create(
+            name="C", certificates_set=archived, course=self.course
+        )
+        archived.active = False
+        archived.save()
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/statistics/")
+        data = response.json()
+        self.assertEqual(data["certificates_count"], 2)
+        self.assertEqual(data["sets_by_status"], {"draft": 2})
+        self.assertEqual(data["study_centers"][0]["sets"], 2)
+        self.assertEqual(data["courses"][0]["certificates_count"], 1)
+
+
+class NearbyStudyCenterTests(TestCase):
+    def setUp(self):
+        # Tashkent, Samarkand, Bukhara and Moscow
+        for name, latitude, longitude in (
+            ("Tashkent", 41.3111, 69.2797),
+            ("Samarkand", 39.6542, 66.9597),
+            ("Bukhara", 39.7681, 64.4556),
+            ("Moscow", 55.7558, 37.6173),
+        ):
+            create_study_center(name, latitude=latitude, longitude=longitude)
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomUser.objects.create(username="staff", is_staff=True)
+        )
+
+    def search(self, query):
+        response = self.client.get(
+            f"/api/study-centers/nearby/?latitude=41.3&longitude=69.2&{query}"
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def test_k_nearest_sorted_by_distance(self):
+        results = self.search("k=3")
+        self.assertEqual(
+            [result["name"] for result in results],
+            ["Tashkent", "Samarkand", "Bukhara"],
+        )
+        self.assertLess(results[0]["distance_km"], 10)
+
+    def test_radius(self):
+        results = self.search("radius_km=300")
+        self.assertEqual(
+            [result["name"] for result in results], ["Tashkent", "Samarkand"]
+        )
+
+    def test_k_widens_to_distant_centers(self):
+        self.assertEqual(self.search("k=10")[-1]["name"], "Moscow")
+
+    def test_zero_radius_is_not_unlimited(self):
+        self.assertEqual(self.search("radius_km=0"), [])
+        results = self.client.get(
+            "/api/study-centers/nearby/?latitude=41.3111&longitude=69.2797"
+            "&radius_km=0"
+        ).json()["results"]
+        self.assertEqual([result["name"] for result in results], ["Tashkent"])
+
+
+class CourseImageNormalizationTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = self.settings(
+            MEDIA_ROOT=media_root.name, COURSE_IMAGE_MAX_SIZE=100
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_upload_is_rotated_capped_and_thumbnailed(self):
+        # 200x100 stored sideways: EXIF orientation 6 shows it as 100x200
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = io.BytesIO()
+        Image.new("RGB", (200, 100), "white").save(buffer, "JPEG", exif=exif)
+
+        course = create_course(
+            image=SimpleUploadedFile("background.jpg", buffer.getvalue()),
+            name_coordinates={"x": 100, "y": 40, "size": 20},
+        )
+
+        with Image.open(course.image.path) as master:
+            self.assertEqual(master.size, (50, 100))
+            self.assertEqual(master.mode, "RGB")
+            self.assertNotIn(0x0112, master.getexif())
+        self.assertEqual(course.name_coordinates, {"x": 50, "y": 20, "size": 10})
+        self.assertTrue(course.thumbnail.name.startswith("courses/thumbnails/"))
+
+        # Later saves keep the stored master as is
+        course.name = "Renamed"
+        course.save()
+        self.assertEqual(course.name_coordinates, {"x": 50, "y": 20, "size": 10})
+
+    def upload(self, size, name="background.png"):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "white").save(buffer, "PNG")
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_only_coordinates_sent_with_upload_are_scaled(self):
+        course = create_course(
+            image=self.upload((80, 60)),
+            name_coordinates={"x": 40, "y": 30, "size": 10},
+        )
+        self.assertEqual(course.name_coordinates, {"x": 40, "y": 30, "size": 10})
+
+        # A new 400x300 image alone: stored coordinates stay as they are
+        course = Course.objects.get(pk=course.pk)
+        course.image = self.upload((400, 300))
+        course.save()
+        self.assertEqual(course.name_coordinates, {"x": 40, "y": 30, "size": 10})
+        self.assertEqual(course.id_coordinates, {"x": 100, "y": 100, "size": 20})
+
+        # Coordinates sent with it are in its pixels and scaled to the master
+        course = Course.objects.get(pk=course.pk)
+        course.image = self.upload((400, 300))
+        course.name_coordinates = {"x": 200, "y": 150, "size": 40}
+        course.save()
+        self.assertEqual(course.name_coordinates, {"x": 50, "y": 38, "size": 10})
+        self.assertEqual(course.id_coordinates, {"x": 100, "y": 100, "size": 20})
+
+    def test_reupload_deletes_replaced_files(self):
+        course = create_course(image=self.upload((80, 60)))
+        old_paths = [course.image.path, course.thumbnail.path]
+
+        course = Course.objects.get(pk=course.pk)
+        course.image = self.upload((400, 300))
+        with self.captureOnCommitCallbacks(execute=True):
+            course.save()
+
+        for path in old_paths:
+            self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(course.image.path))
+        self.assertTrue(os.path.exists(course.thumbnail.path))
+
+    def test_api_patch_with_only_an_image(self):
+        course = create_course(
+            image=self.upload((80, 60)),
+            name_coordinates={"x": 40, "y": 30, "size": 10},
+        )
+        client = APIClient()
+        client.force_authenticate(
+            CustomUser.objects.create(username="staff", is_staff=True)
+        )
+        for _ in range(2):
+            response = client.patch(
+                f"/api/courses/{course.pk}/",
+                {"image": self.upload((800, 600))},
+                format="multipart",
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json()["name_coordinates"], {"x": 40, "y": 30, "size": 10}
+            )
+
+    def test_thumbnail_backfill(self):
+        course = create_course(image=self.upload((80, 60)))
+        Course.objects.filter(pk=course.pk).update(thumbnail=None)
+        without_image = create_course("Missing")
+
+        output = io.StringIO()
+        call_command("make_course_thumbnails", stdout=output, stderr=io.StringIO())
+
+        course.refresh_from_db()
+        with Image.open(course.thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.format, "JPEG")
+        without_image.refresh_from_db()
+        self.assertFalse(without_image.thumbnail)
+        self.assertIn("1 thumbnails", output.getvalue())
+
+
+class RenderJobTests(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+        self.course = create_course()
+        write_background(self.course)
+        self.study_center = create_study_center()
+        self.certificates_set = create_certificates_set(self.study_center)
+        for name in ("Alice", "Bob"):
+            Certificate.objects.create(
+                name=name, certificates_set=self.certificates_set, course=self.course
+            )
+
+    def test_enqueue_reuses_unfinished_job(self):
+        job, created = enqueue_render_job(self.certificates_set)
+        self.assertTrue(created)
+        self.assertEqual(job.total, 2)
+        self.certificates_set.refresh_from_db()
+        self.assertEqual(self.certificates_set.status, "pending")
+
+        same_job, created = enqueue_render_job(self.certificates_set)
+        self.assertFalse(created)
+        self.assertEqual(same_job, job)
+
+        # Other output options need their own archive
+        _, created = enqueue_render_job(
+            self.certificates_set, options=Certificates.get_output_options("pdf")
+        )
+        self.assertTrue(created)
+
+    def test_parallel_jobs_share_set_status(self):
+        png_job, _ = enqueue_render_job(self.certificates_set)
+        pdf_job, _ = enqueue_render_job(
+            self.certificates_set, options=Certificates.get_output_options("pdf")
+        )
+
+        # The PDF job is still queued, so canceling PNG keeps the set pending
+        cancel_render_job(png_job)
+        self.certificates_set.refresh_from_db()
+        self.assertEqual(self.certificates_set.status, "pending")
+
+        job = run_job(claim_next_job(), progress_interval=0)
+        self.assertEqual(job, pdf_job)
+        self.assertEqual(job.status, "completed")
+        self.certificates_set.refresh_from_db()
+        self.assertEqual(self.certificates_set.status, "completed")
+
+    def test_claim_and_run(self):
+        job, _ = enqueue_render_job(self.certificates_set)
+        claimed = claim_next_job()
+        self.assertEqual(claimed, job)
+        self.assertEqual(claimed.status, "running")
+        self.assertIsNone(claim_next_job())
+
+        job = run_job(claimed, progress_interval=0)
+        self.assertEqual(job.status, "completed")
+        self.assertEqual(job.processed, 2)
+        self.certificates_set.refresh_from_db()
+        self.assertEqual(self.certificates_set.status, "completed")
+        with job.result.open("rb") as archive, zipfile.ZipFile(archive) as zip_file:
+            self.assertEqual(zip_file.namelist(), ["Alice.png", "Bob.png"])
+
+    def test_stale_running_job_is_reclaimed(self):
+        job, _ = enqueue_render_job(self.certificates_set)
+        dead_worker_job = claim_next_job()
+        self.assertIsNone(claim_next_job())
+
+        CertificateRenderJob.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+        reclaimed = claim_next_job()
+        self.assertEqual(reclaimed, job)
+        self.assertGreater(reclaimed.started_at, dead_worker_job.started_at)
+
+        # The first worker no longer owns the job and stops at its next update
+        job = run_job(dead_worker_job, progress_interval=0)
+        self.assertEqual(job.status, "running")
+        self.assertFalse(CertificateRenderJob.objects.get(pk=job.pk).result)
+        self.assertEqual(run_job(reclaimed, progress_interval=0).status, "completed")
+
+    def test_cancel_mid_run(self):
+        job, _ = enqueue_render_job(self.certificates_set)
+        job = claim_next_job()
+        render = Certificates.generate_one_certificate
+
+        def render_then_cancel(certificate, options=None):
+            cancel_render_job(job)
+            return render(certificate, options)
+
+        with mock.patch.object(
+            Certificates, "generate_one_certificate", render_then_cancel
+        ):
+            job = run_job(job, progress_interval=0)
+
+        self.assertEqual(job.status, "canceled")
+        self.assertEqual(job.processed, 0)
+        self.assertFalse(job.result)
+        self.certificates_set.refresh_from_db()
+        self.assertEqual(self.certificates_set.status, "canceled")
+
+    def test_failure_returns_set_to_draft(self):
+        os.remove(self.course.image.path)
+        enqueue_render_job(self.certificates_set)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            job = run_job(claim_next_job())
+
+        self.assertEqual(job.status, "failed")
+        self.assertIn("No valid certificates", job.error)
+        self.certificates_set.refresh_from_db()
+        self.assertEqual(self.certificates_set.status, "draft")
+
+    def test_download(self):
+        client = APIClient()
+        client.force_authenticate(
+            CustomUser.objects.create(username="staff", is_staff=True)
+        )
+        response = client.post(
+            f"/api/certificate-sets/{self.certificates_set.pk}/generate_zip_job/",
+            {"output_format": "pdf"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 202)
+        download = f"/api/render-jobs/{response.json()['id']}/download/"
+        self.assertEqual(client.get(download).status_code, 409)
+
+        run_job(claim_next_job())
+        response = client.get(download)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF-"))
+
+
+class CertificateStreamingTests(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+        self.course = create_course()
+        write_background(self.course)
+        self.certificates_set = create_certificates_set(create_study_center())
+        for name in ("Alice", "Bob", "Carol"):
+            Certificate.objects.create(
+                name=name, certificates_set=self.certificates_set, course=self.course
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomUser.objects.create(username="staff", is_staff=True)
+        )
+
+    def test_stream_matches_generate_many(self):
+        data = self.certificates_set.get_certificates_data()
+        # ZIP entries carry the current time; pin it so the archives compare
+        now = time.localtime()
+        with mock.patch("time.localtime", return_value=now):
+            chunks = list(Certificates.stream_many_certificates(data))
+            archive = Certificates.generate_many_certificates(data)
+
+        # One chunk per certificate, then the central directory
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(b"".join(chunks), archive)
+        with zipfile.ZipFile(io.BytesIO(archive)) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            self.assertEqual(
+                zip_file.namelist(), ["Alice.png", "Bob.png", "Carol.png"]
+            )
+
+    def test_view_streams_archive(self):
+        response = self.client.get(
+            f"/api/certificate-sets/{self.certificates_set.pk}/generate_zip/"
+        )
+        self.assertTrue(response.streaming)
+        archive = b"".join(response.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(archive)) as zip_file:
+            self.assertEqual(len(zip_file.namelist()), 3)
+
+    def test_empty_set_raises_before_streaming(self):
+        data = {"zip_name": "Empty", "certificates": [{"name": "No background"}]}
+        with self.assertRaisesMessage(ValueError, "No valid certificates"):
+            Certificates.stream_many_certificates(data)
+
+        empty_set = create_certificates_set(self.certificates_set.study_center)
+        response = self.client.get(
+            f"/api/certificate-sets/{empty_set.pk}/generate_zip/"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.streaming)
+
+
+@override_settings(CERTIFICATE_RENDER_WORKERS=2)
+class RenderPoolTests(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+        self.addCleanup(shutdown_render_pool)
+        course = create_course()
+        background = write_background(course)
+        self.data = {
+            "certificates": [
+                {"bg_image_path": background, "name": f"Student {i}", "texts": []}
+                for i in range(6)
+            ]
+        }
+        # Invalid entries: no name, no background
+        self.data["certificates"][1]["name"] = ""
+        self.data["certificates"][4]["bg_image_path"] = ""
+
+    def test_pool_matches_serial_order_and_skipping(self):
+        serial = list(Certificates.render_certificates(self.data, workers=1))
+        pooled = list(Certificates.render_certificates(self.data, workers=2))
+
+        self.assertEqual(
+            [image["name"] for image in pooled],
+            ["Student 0", "Student 2", "Student 3", "Student 5"],
+        )
+        self.assertEqual(pooled, serial)
+
+    def test_pool_is_reused_across_archives(self):
+        list(Certificates.render_certificates(self.data, workers=2))
+        pool = get_render_pool()
+        list(Certificates.render_certificates(self.data, workers=2))
+        self.assertIs(get_render_pool(), pool)
+
+
+class RenderTemplateCacheTests(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+        self.course = create_course()
+        write_background(self.course)
+        self.certificate = Certificate.objects.create(
+            name="Student",
+            certificates_set=create_certificates_set(create_study_center()),
+            course=self.course,
+        )
+
+    def get_template(self):
+        self.course.refresh_from_db()
+        self.certificate.refresh_from_db()
+        return Certificates.get_template(
+            self.certificate.get_render_data(self.course.get_render_layout())
+        )
+
+    def test_unchanged_course_reuses_template(self):
+        template = self.get_template()
+        self.assertIs(self.get_template(), template)
+        # Other certificates of the course share it
+        Certificate.objects.create(
+            name="Other",
+            certificates_set=self.certificate.certificates_set,
+            course=self.course,
+        )
+        self.assertIs(self.get_template(), template)
+
+    def test_changed_image_builds_fresh_template(self):
+        template = self.get_template()
+        write_background(self.course, color="black")
+        self.course.save()
+
+        fresh = self.get_template()
+        self.assertIsNot(fresh, template)
+        self.assertEqual(fresh.image.getpixel((0, 0)), (0, 0, 0))
+
+    def test_changed_coordinates_build_fresh_template(self):
+        template = self.get_template()
+        self.course.name_coordinates = {"x": 150, "y": 100, "size": 20}
+        self.course.save()
+
+        fresh = self.get_template()
+        self.assertIsNot(fresh, template)
+        self.assertEqual(fresh.text_slots[0][:2], (150, 100))
+        # The unchanged background is still decoded from the file
+        self.assertEqual(fresh.image.size, template.image.size)
+
+    def test_cache_bounded_by_decoded_bytes(self):
+        courses = [self.course, create_course("Second"), create_course("Third")]
+        for course in courses[1:]:
+            write_background(course)
+        certificates_set = self.certificate.certificates_set
+
+        def get_template(course):
+            certificate = Certificate.objects.create(
+                name="Student", certificates_set=certificates_set, course=course
+            )
+            return Certificates.get_template(
+                certificate.get_render_data(course.get_render_layout())
+            )
+
+        # 400x300 RGB backgrounds are 360,000 bytes decoded, two fit
+        cache = cerificate_generator.LRUCache(
+            800_000, weigh=cerificate_generator._decoded_size
+        )
+        with mock.patch.object(cerificate_generator, "_templates", cache):
+            first = get_template(courses[0])
+            for course in courses[1:]:
+                get_template(course)
+            self.assertEqual(cache._total, 720_000)
+            self.assertIsNot(get_template(courses[0]), first)
+
+
+class FontCacheTests(TestCase):
+    def setUp(self):
+        cerificate_generator._fonts.clear()
+
+    def test_font_is_parsed_once_per_size(self):
+        font_name = "Montserrat-Regular.ttf"
+        with mock.patch(
+            "app.cerificate_generator.ImageFont.truetype",
+            wraps=cerificate_generator.ImageFont.truetype,
+        ) as truetype:
+            first = Certificates.get_font(31, font_name)
+            self.assertIs(Certificates.get_font(31, font_name), first)
+            self.assertEqual(truetype.call_count, 1)
+
+            other_size = Certificates.get_font(32, font_name)
+            self.assertIsNot(other_size, first)
+            self.assertEqual(other_size.size, 32)
+            self.assertEqual(truetype.call_count, 2)
+
+
+class QRCodeTests(TestCase):
+    def setUp(self):
+        cerificate_generator._qrcodes.clear()
+
+    def test_transparent_rgba_at_target_size(self):
+        img = Certificates.generate_qrcode("https://example.com/certificate/ID1", 150)
+
+        self.assertEqual(img.mode, "RGBA")
+        self.assertEqual(img.size, (150, 150))
+        # The quiet zone (light modules) is transparent, dark modules opaque
+        self.assertEqual(img.getpixel((0, 0))[3], 0)
+        alphas = img.getchannel("A").getextrema()
+        self.assertEqual(alphas, (0, 255))
+        self.assertEqual(
+            {pixel[:3] for pixel in img.getdata() if pixel[3]}, {(0, 0, 0)}
+        )
+
+    def test_repeat_calls_are_memoized(self):
+        url = "https://example.com/certificate/ID2"
+        with mock.patch.object(
+            Certificates, "_render_qrcode", wraps=Certificates._render_qrcode
+        ) as render:
+            first = Certificates.generate_qrcode(url, 120)
+            self.assertIs(Certificates.generate_qrcode(url, 120), first)
+            self.assertEqual(render.call_count, 1)
+
+            self.assertEqual(Certificates.generate_qrcode(url, 90).size, (90, 90))
+            self.assertEqual(render.call_count, 2)
+
+
+class RenderCacheTests(TestCase):
+    def setUp(self):
+        self.media_root = use_temp_media(self)
+        self.cache = RenderCache(os.path.join(self.media_root, "render-cache"), 10**9)
+        self.course = create_course()
+        write_background(self.course)
+        self.certificate = Certificate.objects.create(
+            name="Student",
+            certificates_set=create_certificates_set(create_study_center()),
+            course=self.course,
+        )
+
+    def render(self):
+        self.certificate.refresh_from_db()
+        with mock.patch.object(
+            Certificates,
+            "generate_one_certificate",
+            wraps=Certificates.generate_one_certificate,
+        ) as render:
+            image = Certificates.generate_cached_certificate(
+                self.certificate.get_render_data(), self.cache
+            )
+        return image, render.called
+
+    def test_hit_after_first_render(self):
+        image, rendered = self.render()
+        self.assertTrue(rendered)
+        cached, rendered = self.render()
+        self.assertFalse(rendered)
+        self.assertEqual(cached, image)
+
+    def test_miss_after_name_change(self):
+        self.render()
+        self.certificate.name = "Renamed"
+        self.certificate.save()
+        image, rendered = self.render()
+        self.assertTrue(rendered)
+        self.assertEqual(image["name"], "Renamed")
+
+    def test_miss_after_background_change(self):
+        self.render()
+        path = write_background(self.course, size=(500, 300))
+        # Make sure the mtime moves even on coarse filesystem timestamps
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+        image, rendered = self.render()
+        self.assertTrue(rendered)
+        with Image.open(io.BytesIO(image["content"])) as img:
+            self.assertEqual(img.size, (500, 300))
+
+    def test_prune_evicts_least_recently_used(self):
+        for i, key in enumerate(("aa-old", "bb-used", "cc-new")):
+            self.cache.set(key, bytes(100))
+            os.utime(self.cache._path(key), (i, i))
+        # A hit makes an entry the most recently used
+        self.assertIsNotNone(self.cache.get("aa-old"))
+
+        self.assertEqual(self.cache.prune(max_bytes=250), (1, 100))
+        self.assertIsNone(self.cache.get("bb-used"))
+        self.assertIsNotNone(self.cache.get("aa-old"))
+        self.assertIsNotNone(self.cache.get("cc-new"))
+
+    def test_single_image_renders_prune(self):
+        directory = os.path.join(self.media_root, "endpoint-cache")
+        path = f"/api/get-certificate/{self.certificate.UUID}/image/"
+        with self.settings(
+            CERTIFICATE_RENDER_CACHE_DIR=directory,
+            CERTIFICATE_RENDER_CACHE_MAX_BYTES=1,
+        ):
+            get_render_cache().prune_interval = 2
+            for name in ("A", "B", "C", "D"):
+                self.certificate.name = name
+                self.certificate.save()
+                self.assertEqual(APIClient().get(path).status_code, 200)
+            # Each request looks the cache up again but shares its counter
+            self.assertIs(get_render_cache(), get_render_cache())
+        files = [name for _, _, names in os.walk(directory) for name in names]
+        self.assertEqual(files, [])
+
+
+class ArchiveFormatTests(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+        self.course = create_course()
+        write_background(self.course)
+        certificates_set = create_certificates_set(create_study_center())
+        for name in ("Alice", "Bob", "Carol"):
+            Certificate.objects.create(
+                name=name, certificates_set=certificates_set, course=self.course
+            )
+        self.data = certificates_set.get_certificates_data()
+
+    def generate(self, image_format, **options):
+        options = Certificates.get_output_options(image_format, **options)
+        return Certificates.generate_many_certificates(self.data, options=options)
+
+    def test_image_formats(self):
+        for image_format, extension, pil_format in (
+            ("png", "png", "PNG"),
+            ("jpeg", "jpg", "JPEG"),
+            ("webp", "webp", "WEBP"),
+        ):
+            with self.subTest(image_format):
+                archive = zipfile.ZipFile(io.BytesIO(self.generate(image_format)))
+                self.assertEqual(
+                    archive.namelist(),
+                    [f"{name}.{extension}" for name in ("Alice", "Bob", "Carol")],
+                )
+                with Image.open(archive.open(archive.namelist()[0])) as img:
+                    self.assertEqual(img.format, pil_format)
+                    self.assertEqual(img.size, (400, 300))
+
+    def test_stored_and_deflated(self):
+        stored = zipfile.ZipFile(io.BytesIO(self.generate("png")))
+        deflated = zipfile.ZipFile(
+            io.BytesIO(self.generate("png", compression="deflated"))
+        )
+        self.assertEqual(
+            {info.compress_type for info in stored.infolist()}, {zipfile.ZIP_STORED}
+        )
+        self.assertEqual(
+            {info.compress_type for info in deflated.infolist()},
+            {zipfile.ZIP_DEFLATED},
+        )
+        self.assertEqual(stored.read("Bob.png"), deflated.read("Bob.png"))
+
+    def test_png_compress_level(self):
+        fast = zipfile.ZipFile(io.BytesIO(self.generate("png")))
+        small = zipfile.ZipFile(io.BytesIO(self.generate("png", compress_level=9)))
+        self.assertLessEqual(
+            len(small.read("Alice.png")), len(fast.read("Alice.png"))
+        )
+
+    def test_pdf_structure(self):
+        pdf = self.generate("pdf", quality=70)
+
+        self.assertTrue(pdf.startswith(b"%PDF-1.4\n"))
+        self.assertTrue(pdf.endswith(b"%%EOF\n"))
+        startxref = int(pdf.rsplit(b"startxref\n", 1)[1].split(b"\n")[0])
+        self.assertEqual(pdf[startxref : startxref + 5], b"xref\n")
+
+        # Every cross-reference entry points at the start of its object
+        lines = pdf[startxref:].split(b"\n")
+        size = int(lines[1].split()[1])
+        self.assertEqual(size, 3 + 3 * 3)
+        for number, line in enumerate(lines[3 : 2 + size], start=1):
+            offset = int(line.split()[0])
+            self.assertTrue(pdf[offset:].startswith(f"{number} 0 obj\n".encode()))
+        self.assertIn(f"/Size {size} /Root 1 0 R".encode(), pdf)
+
+        self.assertIn(b"/Type /Pages", pdf)
+        self.assertIn(b"/Count 3 >>", pdf)
+        self.assertEqual(pdf.count(b"/Type /Page "), 3)
+        # 400x300 px at 300 DPI
+        self.assertEqual(pdf.count(b"/MediaBox [0 0 96.00 72.00]"), 3)
+        self.assertEqual(pdf.count(b"/Filter /DCTDecode"), 3)
+
+
+class CertificateImageTests(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+        self.course = create_course()
+        write_background(self.course)
+        self.certificates_set = create_certificates_set(create_study_center())
+        self.certificate = Certificate.objects.create(
+            name="Student", certificates_set=self.certificates_set, course=self.course
+        )
+        self.path = f"/api/get-certificate/{self.certificate.UUID}/image/"
+        self.client = APIClient()
+        views._rendered_images.clear()
+
+    def test_validators(self):
+        response = self.client.get(self.path)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        certificate = Certificate.objects.select_related(
+            "course", "certificates_set"
+        ).get(pk=self.certificate.pk)
+        etag, last_modified = certificate.get_render_version()
+        self.assertEqual(response["ETag"], f'"{etag}-png"')
+        self.assertEqual(
+            response["Last-Modified"], http_date(last_modified.timestamp())
+        )
+        self.assertIn("max-age=300", response["Cache-Control"])
+
+        # The format is part of the representation, encoder settings are not
+        response = self.client.get(f"{self.path}?output_format=jpeg&quality=70")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response["ETag"], f'"{etag}-jpeg"')
+
+    def test_memory_cache_without_disk_cache(self):
+        with mock.patch.object(
+            Certificates,
+            "generate_one_certificate",
+            wraps=Certificates.generate_one_certificate,
+        ) as render:
+            first = self.client.get(self.path)
+            second = self.client.get(self.path)
+            self.certificate.name = "Renamed"
+            self.certificate.save()
+            self.client.get(self.path)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(render.call_count, 2)
+
+    def test_not_modified(self):
+        response = self.client.get(self.path)
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+        response = self.client.get(self.path, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_changes_with_inputs(self):
+        etags = [self.client.get(self.path)["ETag"]]
+        self.certificate.name = "Renamed"
+        self.certificate.save()
+        etags.append(self.client.get(self.path)["ETag"])
+        self.certificates_set.finished_date = datetime.date(2025, 6, 1)
+        self.certificates_set.save()
+        etags.append(self.client.get(self.path)["ETag"])
+        self.course.name_coordinates = {"x": 120, "y": 100, "size": 20}
+        self.course.save()
+        etags.append(self.client.get(self.path)["ETag"])
+
+        self.assertEqual(len(set(etags)), 4)
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(response.status_code, 200)
+
+
+class CertificateLookupTests(TestCase):
+    def setUp(self):
+        caches["responses"].clear()
+        self.course = create_course()
+        self.study_center = create_study_center()
+        self.certificates_set = create_certificates_set(self.study_center)
+        self.certificate = Certificate.objects.create(
+            name="Student", certificates_set=self.certificates_set, course=self.course
+        )
+        self.path = f"/api/get-certificate/{self.certificate.UUID}/"
+        self.client = APIClient()
+
+    def get(self, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_one_query_then_cached(self):
+        data = self.get(1)
+        self.assertEqual(data["name"], "Student")
+        self.assertEqual(data["course"]["name"], "Course")
+        self.assertEqual(data["certificates_set"]["status"], "draft")
+        self.assertEqual(data["study_center"], "Center")
+        self.assertEqual(self.get(0), data)
+
+    def test_certificate_change_invalidates(self):
+        self.get(1)
+        self.certificate.name = "Renamed"
+        self.certificate.save()
+        self.assertEqual(self.get(1)["name"], "Renamed")
+
+    def test_set_change_invalidates(self):
+        self.get(1)
+        # Render jobs save only the status
+        self.certificates_set.status = "completed"
+        self.certificates_set.save(update_fields=["status"])
+        self.assertEqual(self.get(1)["certificates_set"]["status"], "completed")
+
+    def test_course_change_invalidates(self):
+        self.get(1)
+        self.course.name = "Renamed"
+        self.course.save()
+        self.assertEqual(self.get(1)["course"]["name"], "Renamed")
+
+    def test_study_center_change_invalidates(self):
+        self.get(1)
+        self.study_center.name = "Renamed"
+        self.study_center.save()
+        self.assertEqual(self.get(1)["study_center"], "Renamed")
+
+    def test_bulk_change_invalidates(self):
+        self.get(1)
+        client = APIClient()
+        client.force_authenticate(
+            CustomUser.objects.create(username="staff", is_staff=True)
+        )
+        client.post(
+            "/api/certificates/bulk_update/",
+            {"ids": [self.certificate.pk], "patch": {"name": "Bulk"}},
+            format="json",
+        )
+        self.assertEqual(self.get(1)["name"], "Bulk")
+
+    def test_omits_set_counter(self):
+        # Siblings added later would leave a cached count stale
+        self.assertNotIn("certificates_count", self.get(1)["certificates_set"])
+
+
+class CertificateBulkTests(TestCase):
+    def setUp(self):
+        self.course = create_course()
+        self.manager = CustomUser.objects.create(username="manager")
+        self.study_center = create_study_center(manager=self.manager)
+        self.other_center = create_study_center("Other")
+        self.first_set = create_certificates_set(self.study_center, "First")
+        self.second_set = create_certificates_set(self.study_center, "Second")
+        self.other_set = create_certificates_set(self.other_center, "Other")
+        self.certificates = {
+            name: Certificate.objects.create(
+                name=name, certificates_set=certificates_set
+            )
+            for name, certificates_set in (
+                ("A", self.first_set),
+                ("B", self.first_set),
+                ("C", self.second_set),
+                ("D", self.other_set),
+            )
+        }
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomUser.objects.create(username="staff", is_staff=True)
+        )
+
+    def post(self, action, data):
+        return self.client.post(f"/api/certificates/{action}/", data, format="json")
+
+    def active_names(self):
+        return set(
+            Certificate.objects.filter(active=True).values_list("name", flat=True)
+        )
+
+    def test_select_by_ids(self):
+        ids = [self.certificates["A"].pk, self.certificates["C"].pk]
+        response = self.post("bulk_delete", {"ids": ids})
+        self.assertEqual(response.json(), {"deleted": 2})
+        self.assertEqual(self.active_names(), {"B", "D"})
+
+    def test_select_by_filter(self):
+        response = self.post(
+            "bulk_update",
+            {
+                "filter": {"certificates_set": self.first_set.pk},
+                "patch": {"course": self.course.pk},
+            },
+        )
+        self.assertEqual(response.json(), {"updated": 2})
+        self.assertEqual(
+            set(
+                Certificate.objects.filter(course=self.course).values_list(
+                    "name", flat=True
+                )
+            ),
+            {"A", "B"},
+        )
+
+    def test_ids_and_filter_are_exclusive(self):
+        response = self.post(
+            "bulk_delete",
+            {"ids": [self.certificates["A"].pk], "filter": {"name": "A"}},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post("bulk_delete", {}).status_code, 400)
+
+    def test_unknown_filter_key_is_rejected(self):
+        response = self.post(
+            "bulk_delete", {"filter": {"certficates_set": self.first_set.pk}}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("certficates_set", response.json()["filter"])
+        self.assertEqual(len(self.active_names()), 4)
+
+    def test_filter_narrowing_nothing_is_rejected(self):
+        response = self.post("bulk_delete", {"filter": {"name": ""}})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.active_names()), 4)
+
+    def test_invalid_filter_value_is_rejected(self):
+        response = self.post("bulk_delete", {"filter": {"certificates_set": 999}})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.active_names()), 4)
+
+    def test_manager_only_reaches_own_center(self):
+        self.client.force_authenticate(self.manager)
+        ids = [certificate.pk for certificate in self.certificates.values()]
+        response = self.post("bulk_delete", {"ids": ids})
+        self.assertEqual(response.json(), {"deleted": 3})
+        self.assertEqual(self.active_names(), {"D"})
+
+        response = self.post(
+            "bulk_update", {"filter": {"name": "D"}, "patch": {"name": "Changed"}}
+        )
+        self.assertEqual(response.json(), {"updated": 0})
+        self.assertEqual(self.active_names(), {"D"})
+
+    def test_manager_cannot_move_into_other_center(self):
+        self.client.force_authenticate(self.manager)
+        response = self.post(
+            "bulk_update",
+            {
+                "ids": [self.certificates["A"].pk],
+                "patch": {"certificates_set": self.other_set.pk},
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("certificates_set", response.json()["patch"])
+        self.certificates["A"].refresh_from_db()
+        self.assertEqual(self.certificates["A"].certificates_set, self.first_set)
+
+        response = self.post(
+            "bulk_update",
+            {
+                "ids": [self.certificates["A"].pk],
+                "patch": {"certificates_set": self.second_set.pk},
+            },
+        )
+        self.assertEqual(response.json(), {"updated": 1})
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        certificates_set = create_certificates_set(create_study_center())
+        Certificate.objects.bulk_create(
+            Certificate(
+                UUID=f"PAGE{i}", name=f"Student {i}", certificates_set=certificates_set
+            )
+            for i in range(250)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(
+            CustomUser.objects.create(username="staff", is_staff=True)
+        )
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_continue_without_gaps_or_repeats(self):
+        page = self.get("/api/certificates/?page_size=60")
+        self.assertEqual(set(page), {"next", "previous", "results"})
+        self.assertIsNone(page["previous"])
+
+        ids, pages = [], []
+        while True:
+            pages.append(page)
+            ids.extend(result["id"] for result in page["results"])
+            if not page["next"]:
+                break
+            page = self.get(page["next"])
+
+        self.assertEqual([len(page["results"]) for page in pages], [60] * 4 + [10])
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(
+            ids,
+            list(
+                Certificate.objects.order_by("-id").values_list("id", flat=True)
+            ),
+        )
+
+        # Rows added after the first page don't shift later pages
+        second = self.get(pages[0]["next"])
+        Certificate.objects.create(
+            name="Late", certificates_set=CertificatesSet.objects.get()
+        )
+        self.assertEqual(self.get(pages[0]["next"]), second)
+        self.assertEqual(self.get(second["previous"])["results"], pages[0]["results"])
+
+    def test_default_and_max_page_size(self):
+        self.assertEqual(len(self.get("/api/certificates/")["results"]), 50)
+        self.assertEqual(
+            len(self.get("/api/certificates/?page_size=1000")["results"]), 200
+        )
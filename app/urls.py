@@ -8,10 +8,17 @@ router.register("users", UserViewSet)
 router.register("courses", CourseViewSet)
 router.register("certificate-sets", CertificatesSetViewSet)
 router.register("certificates", CertificatesViewSet)
+router.register("render-jobs", CertificateRenderJobViewSet, basename="render-jobs")
 
 urlpatterns = [
     path("", include(router.urls)),
     path(
         "get-certificate/<str:uuid>/", certificate_by_uuid, name="get_certificate"
     ),
+    path(
+        "get-certificate/<str:uuid>/image/",
+        certificate_image_by_uuid,
+        name="get_certificate_image",
+    ),
+    path("statistics/", statistics, name="statistics"),
 ]
@@ -1,15 +1,26 @@
 from rest_framework import viewsets
 from rest_framework.decorators import action
-from django.http import HttpResponse
+from rest_framework.exceptions import ValidationError
+from django_filters.constants import EMPTY_VALUES
+from django_filters.rest_framework import DjangoFilterBackend
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import Response, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
 from .models import (
     StudyCenter,
     CustomUser,
     Course,
     Certificate,
     CertificatesSet,
+    CertificateRenderJob,
+    recount_certificates,
 )
 from .serializers import (
     StudyCenterSerializer,
@@ -17,20 +28,72 @@ from .serializers import (
     CertificateSerializer,
     CourseSerializer,
     CertificatesSetSerializer,
+    CertificateRenderJobSerializer,
+    ArchiveOptionsSerializer,
+    ImageOptionsSerializer,
+    CertificateBulkSerializer,
+    CertificateBulkUpdateSerializer,
+    NearbySearchSerializer,
+)
+from .cerificate_generator import Certificates, LRUCache
+from .render_jobs import (
+    enqueue_render_job,
+    cancel_render_job,
+    archive_extension,
+    archive_content_type,
+)
+from .render_cache import get_render_cache
+from .mixins import DynamicFieldsViewSetMixin, VersionedResponseCacheMixin
+from .importers import import_certificates, ImportFileError
+from .geo import find_nearest
+from .caching import (
+    get_certificate_lookup,
+    set_certificate_lookup,
+    invalidate_certificate_lookups,
 )
-from .cerificate_generator import Certificates
-
-frontend_url = "https://study-app.ucrm.uz"
 
 
 # Create your views here.
-class StudyCenterViewSet(viewsets.ModelViewSet):
+class StudyCenterViewSet(
+    VersionedResponseCacheMixin, DynamicFieldsViewSetMixin, viewsets.ModelViewSet
+):
     queryset = StudyCenter.objects.filter(active=True)
     serializer_class = StudyCenterSerializer
     permission_classes = [IsAuthenticated]
+    # displayManager embeds the manager
+    cache_models = (StudyCenter, CustomUser)
+    dynamic_fields_actions = ("list", "retrieve", "nearby")
 
+    @action(methods=["GET"], detail=False)
+    def nearby(self, request):
+        """
+        Study centers sorted by distance from ?latitude=&longitude=, limited
+        to ?radius_km= and/or the ?k= nearest.
+        """
+        params = NearbySearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        search = params.validated_data
+
+        queryset = self.filter_queryset(self.get_queryset())
+        ranked = find_nearest(
+            queryset,
+            search["latitude"],
+            search["longitude"],
+            search["k"],
+            search.get("radius_km"),
+        )
+        study_centers = queryset.in_bulk([pk for _, pk in ranked])
+        ranked = [(distance, pk) for distance, pk in ranked if pk in study_centers]
+        serializer = self.get_serializer(
+            [study_centers[pk] for _, pk in ranked], many=True
+        )
+        results = serializer.data
+        for result, (distance, _) in zip(results, ranked):
+            result["distance_km"] = round(distance, 3)
+        return Response({"results": results})
 
-class UserViewSet(viewsets.ModelViewSet):
+
+class UserViewSet(DynamicFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = CustomUser.objects.filter(is_active=True)
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
@@ -42,20 +105,113 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(
+    VersionedResponseCacheMixin, DynamicFieldsViewSetMixin, viewsets.ModelViewSet
+):
     queryset = Course.objects.filter(active=True)
     serializer_class = CourseSerializer
     permission_classes = [IsAuthenticated]
+    cache_models = (Course,)
 
 
-class CertificatesViewSet(viewsets.ModelViewSet):
+class CertificatesViewSet(DynamicFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = Certificate.objects.filter(active=True)
     serializer_class = CertificateSerializer
     permission_classes = [IsAuthenticated]
     filterset_fields = "__all__"
 
+    def get_queryset(self):
+        queryset = Certificate.objects.filter(active=True)
+        if self.request.user.is_manager:
+            queryset = queryset.filter(
+                certificates_set__study_center=self.request.user.study_center
+            )
+        return queryset
+
+    def get_bulk_queryset(self, validated_data):
+        """
+        Scoped certificates selected by 'ids' or by a list-endpoint filter.
+        """
+        queryset = self.get_queryset()
+        if "ids" in validated_data:
+            return queryset.filter(pk__in=validated_data["ids"])
+
+        filterset_class = DjangoFilterBackend().get_filterset_class(self, queryset)
+        filterset = filterset_class(
+            data=validated_data["filter"], queryset=queryset, request=self.request
+        )
+        # FilterSet ignores unknown keys and empty values, which here would
+        # silently select every certificate in scope
+        unknown = set(validated_data["filter"]) - set(filterset.filters)
+        if unknown:
+            raise ValidationError(
+                {"filter": {name: ["Unknown filter."] for name in sorted(unknown)}}
+            )
+        if not filterset.is_valid():
+            raise ValidationError({"filter": filterset.errors})
+        if all(
+            value in EMPTY_VALUES for value in filterset.form.cleaned_data.values()
+        ):
+            raise ValidationError({"filter": ["Filter does not narrow the selection."]})
+        return filterset.qs
+
+    def get_counted_ids(self, queryset):
+        """
+        Sets and courses whose certificates_count a bulk change may affect.
+        """
+        rows = queryset.values_list("certificates_set_id", "course_id").distinct()
+        set_ids, course_ids = set(), set()
+        for set_id, course_id in rows:
+            set_ids.add(set_id)
+            course_ids.add(course_id)
+        return set_ids, course_ids
+
+    @action(methods=["POST"], detail=False)
+    def bulk_update(self, request):
+        serializer = CertificateBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        patch = serializer.validated_data["patch"]
+
+        # Managers may only move certificates into their own sets
+        target_set = patch.get("certificates_set")
+        if (
+            target_set
+            and request.user.is_manager
+            and target_set.study_center_id != request.user.study_center_id
+        ):
+            raise ValidationError(
+                {"patch": {"certificates_set": ["Set is not in your study center."]}}
+            )
+
+        with transaction.atomic():
+            queryset = self.get_bulk_queryset(serializer.validated_data)
+            invalidate_certificate_lookups(queryset.values_list("UUID", flat=True))
+            set_ids, course_ids = self.get_counted_ids(queryset)
+            updated = queryset.update(**patch, updated_at=timezone.now())
+            if "certificates_set" in patch or "course" in patch:
+                if patch.get("certificates_set"):
+                    set_ids.add(patch["certificates_set"].pk)
+                if patch.get("course"):
+                    course_ids.add(patch["course"].pk)
+                recount_certificates(set_ids, course_ids)
+        return Response({"updated": updated})
+
+    @action(methods=["POST"], detail=False)
+    def bulk_delete(self, request):
+        serializer = CertificateBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Soft delete, like the active=True filter everywhere else expects
+        with transaction.atomic():
+            queryset = self.get_bulk_queryset(serializer.validated_data)
+            invalidate_certificate_lookups(queryset.values_list("UUID", flat=True))
+            set_ids, course_ids = self.get_counted_ids(queryset)
+            deleted = queryset.update(active=False, updated_at=timezone.now())
+            recount_certificates(set_ids, course_ids)
+        return Response({"deleted": deleted})
 
-class CertificatesSetViewSet(viewsets.ModelViewSet):
+
+class CertificatesSetViewSet(DynamicFieldsViewSetMixin, viewsets.ModelViewSet):
     serializer_class = CertificatesSetSerializer
     permission_classes = [IsAuthenticated]
     queryset = CertificatesSet.objects.none()
@@ -76,87 +232,243 @@ class CertificatesSetViewSet(viewsets.ModelViewSet):
     @action(methods=["GET"], detail=True)
     def generate_zip(self, request, pk=None):
         instance = self.get_object()
+        options_serializer = ArchiveOptionsSerializer(data=request.query_params)
+        options_serializer.is_valid(raise_exception=True)
+        options = options_serializer.validated_data
 
-        data = {
-            "zip_name": instance.name,
-            "certificates": [
-                {
-                    "bg_image_path": (
-                        instance.certificates.first().course.image.path
-                        if instance.certificates.exists()
-                        else ""
-                    ),
-                    "name": certificate.name,
-                    "qrcode": {
-                        "url": f"{frontend_url}/certificate/{certificate.UUID}",
-                        "x": certificate.course.qr_code_coordinates["x"],
-                        "y": certificate.course.qr_code_coordinates["y"],
-                        "size": certificate.course.qr_code_coordinates["size"],
-                    },
-                    "texts": [
-                        {
-                            "content": certificate.name,
-                            "x": certificate.course.name_coordinates["x"],
-                            "y": certificate.course.name_coordinates["y"],
-                            "size": certificate.course.name_coordinates["size"],
-                        },
-                        {
-                            "content": certificate.UUID,
-                            "x": certificate.course.id_coordinates["x"],
-                            "y": certificate.course.id_coordinates["y"],
-                            "size": certificate.course.id_coordinates["size"],
-                        },
-                        {
-                            "content": instance.finished_date.strftime("%d.%m.%Y"),
-                            "x": certificate.course.finished_date_coordinates["x"],
-                            "y": certificate.course.finished_date_coordinates["y"],
-                            "size": certificate.course.finished_date_coordinates[
-                                "size"
-                            ],
-                        },
-                    ],
-                }
-                for certificate in instance.certificates.all()
-            ],
-        }
-        
-        # Generate zip in memory
+        data = instance.get_certificates_data()
+
+        # Stream the archive entry by entry as certificates are rendered
         try:
-            zip_data = Certificates.generate_many_certificates(data)
+            archive_stream = Certificates.stream_many_certificates(
+                data, cache=get_render_cache(), options=options
+            )
         except ValueError as e:
             return Response({"error": str(e)}, status=400)
-    
-        response = HttpResponse(zip_data, content_type="application/zip")
-        response["Content-Disposition"] = f'attachment; filename="{data["zip_name"]}.zip"'
+
+        response = StreamingHttpResponse(
+            archive_stream, content_type=archive_content_type(options)
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{data["zip_name"]}.{archive_extension(options)}"'
+        )
         return response
 
+    @action(methods=["POST"], detail=True)
+    def import_certificates(self, request, pk=None):
+        instance = self.get_object()
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response(
+                {"error": "Upload a .csv or .xlsx file in the 'file' field."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            result = import_certificates(instance, upload)
+        except ImportFileError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            result,
+            status=status.HTTP_201_CREATED if result["created"] else status.HTTP_200_OK,
+        )
+
+    @action(methods=["POST"], detail=True)
+    def generate_zip_job(self, request, pk=None):
+        instance = self.get_object()
+        options_serializer = ArchiveOptionsSerializer(data=request.data)
+        options_serializer.is_valid(raise_exception=True)
+        job, created = enqueue_render_job(
+            instance, request.user, options_serializer.validated_data
+        )
+        serializer = CertificateRenderJobSerializer(job, context={"request": request})
+        return Response(
+            serializer.data,
+            status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK,
+        )
+
+
+class CertificateRenderJobViewSet(
+    DynamicFieldsViewSetMixin, viewsets.ReadOnlyModelViewSet
+):
+    serializer_class = CertificateRenderJobSerializer
+    permission_classes = [IsAuthenticated]
+    queryset = CertificateRenderJob.objects.none()
+    filterset_fields = ("certificates_set", "status")
+
+    def get_queryset(self):
+        queryset = CertificateRenderJob.objects.select_related("certificates_set")
+        if self.request.user.is_manager:
+            queryset = queryset.filter(
+                certificates_set__study_center=self.request.user.study_center
+            )
+        return queryset
+
+    @action(methods=["POST"], detail=True)
+    def cancel(self, request, pk=None):
+        job = self.get_object()
+        if not cancel_render_job(job):
+            return Response(
+                {"error": f"Job is already {job.status}."},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(self.get_serializer(job).data)
+
+    @action(methods=["GET"], detail=True)
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != "completed" or not job.result:
+            return Response(
+                {"error": "Archive is not ready.", "status": job.status},
+                status=status.HTTP_409_CONFLICT,
+            )
+        options = job.output_options
+        return FileResponse(
+            job.result.open("rb"),
+            as_attachment=True,
+            filename=f"{job.certificates_set.name}.{archive_extension(options)}",
+            content_type=archive_content_type(options),
+        )
+
 
 @api_view(["GET"])
 def certificate_by_uuid(request, uuid):
     if uuid:
-        try:
-            certificate = Certificate.objects.get(UUID=uuid)
+        response_data = get_certificate_lookup(uuid)
+        if response_data is None:
+            try:
+                certificate = Certificate.objects.select_related(
+                    "course", "certificates_set__study_center"
+                ).get(UUID=uuid)
+            except Certificate.DoesNotExist:
+                return Response(
+                    {"error": "Certificate not found"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+
             serializer = CertificateSerializer(certificate)
 
             # Add the certificate URL to the response data
-            response_data = serializer.data
-            certificate_set = CertificatesSet.objects.filter(
-                certificates__in=[certificate]
-            ).first()
+            response_data = dict(serializer.data)
+            certificate_set = certificate.certificates_set
             response_data["course"] = CourseSerializer(certificate.course).data
+            # Counter updates skip the signals clearing cached lookups
             response_data["certificates_set"] = CertificatesSetSerializer(
-                certificate_set
+                certificate_set, omit={"certificates_count"}
             ).data
-            response_data["study_center"] = StudyCenterSerializer(
-                certificate_set.study_center
-            ).data["name"]
+            response_data["study_center"] = certificate_set.study_center.name
+            set_certificate_lookup(uuid, response_data)
 
-            return Response(response_data)
-        except Certificate.DoesNotExist:
-            return Response(
-                {"error": "Certificate not found"}, status=status.HTTP_404_NOT_FOUND
-            )
+        return Response(response_data)
     else:
         return Response(
             {"error": "UUID is required"}, status=status.HTTP_400_BAD_REQUEST
         )
+
+
+# Fallback for certificate_image_by_uuid when the disk render cache is off
+_rendered_images = LRUCache(getattr(settings, "CERTIFICATE_IMAGE_CACHE_SIZE", 32))
+
+
+@api_view(["GET"])
+def certificate_image_by_uuid(request, uuid):
+    options_serializer = ImageOptionsSerializer(data=request.query_params)
+    options_serializer.is_valid(raise_exception=True)
+    options = options_serializer.validated_data
+
+    certificate = (
+        Certificate.objects.select_related("course", "certificates_set")
+        .filter(UUID=uuid)
+        .first()
+    )
+    if certificate is None or certificate.course is None:
+        return Response(
+            {"error": "Certificate not found"}, status=status.HTTP_404_NOT_FOUND
+        )
+
+    # Validators change whenever the certificate, its set or course change
+    etag, last_modified = certificate.get_render_version()
+    etag = f'"{etag}-{options["format"]}"'
+    last_modified = int(last_modified.timestamp())
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if not_modified is None:
+        data = certificate.get_render_data()
+        cache = get_render_cache()
+        if cache:
+            image = Certificates.generate_cached_certificate(data, cache, options)
+        else:
+            image = _rendered_images.get(etag)
+            if image is None:
+                image = Certificates.generate_one_certificate(data, options)
+                if image is not None:
+                    _rendered_images.set(etag, image)
+        if image is None:
+            return Response(
+                {"error": "Certificate image could not be rendered"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        response = HttpResponse(
+            image["content"], content_type=f"image/{options['format']}"
+        )
+    else:
+        response = not_modified
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(
+        response, public=True, max_age=settings.CERTIFICATE_IMAGE_MAX_AGE
+    )
+    return response
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def statistics(request):
+    """
+    Dashboard counts in one response: sets per status, and certificates per
+    study center and per course. Managers only see their own study center.
+    """
+    sets = CertificatesSet.objects.filter(active=True).order_by()
+    if request.user.is_manager:
+        sets = sets.filter(study_center=request.user.study_center)
+
+    sets_by_status = dict(sets.values_list("status").annotate(Count("id")))
+
+    study_centers = [
+        {
+            "study_center": study_center_id,
+            "name": name,
+            "sets": set_count,
+            "certificates_count": certificates_count or 0,
+        }
+        for study_center_id, name, set_count, certificates_count in sets.values_list(
+            "study_center", "study_center__name"
+        ).annotate(Count("id"), Sum("certificates_count"))
+    ]
+
+    # Course counters also count archived sets, so group the certificates
+    course_counts = (
+        Certificate.objects.filter(
+            active=True, certificates_set__in=sets, course__active=True
+        )
+        .order_by()
+        .values_list("course", "course__name")
+        .annotate(Count("id"))
+    )
+    courses = [
+        {"course": course_id, "name": name, "certificates_count": count}
+        for course_id, name, count in course_counts
+    ]
+
+    return Response(
+        {
+            "certificates_count": sum(
+                row["certificates_count"] for row in study_centers
+            ),
+            "sets_by_status": sets_by_status,
+            "study_centers": study_centers,
+            "courses": courses,
+        }
+    )
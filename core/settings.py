@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "app.middleware.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -89,6 +90,81 @@ DATABASES = {
     }
 }
 
+# Settings merged into the default database when DATABASE_PROFILE=production:
+# WAL lets readers run alongside the render job writer, and connections are
+# kept open across requests so the pragmas are only applied once each.
+SQLITE_PRODUCTION_PROFILE = {
+    "CONN_MAX_AGE": 600,
+    "CONN_HEALTH_CHECKS": True,
+    "OPTIONS": {
+        # Seconds to wait on a lock (SQLite's busy_timeout) before failing
+        # with "database is locked"
+        "timeout": 20,
+        # Take the write lock at BEGIN; a deferred transaction that upgrades
+        # to a writer mid-way fails immediately instead of waiting
+        "transaction_mode": "IMMEDIATE",
+        "init_command": (
+            "PRAGMA journal_mode=WAL;"
+            "PRAGMA synchronous=NORMAL;"
+            "PRAGMA cache_size=-65536;"  # 64 MiB page cache
+            "PRAGMA mmap_size=268435456;"  # 256 MiB memory-mapped reads
+            "PRAGMA temp_store=MEMORY;"
+        ),
+    },
+}
+
+DATABASE_PROFILE = os.environ.get("DATABASE_PROFILE", "default")
+if DATABASE_PROFILE == "production":
+    DATABASES["default"].update(SQLITE_PRODUCTION_PROFILE)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# Backends for the response cache (courses, study centers and
+# certificate_by_uuid), picked with RESPONSE_CACHE_BACKEND. locmem is per
+# process: changes made by other processes, such as run_render_jobs, only
+# show once entries expire, so use file or redis with several processes.
+RESPONSE_CACHE_BACKENDS = {
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "responses",
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache", "responses"),
+    },
+    "redis": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get(
+            "RESPONSE_CACHE_REDIS_URL", "redis://127.0.0.1:6379/1"
+        ),
+    },
+}
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "locmem")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "default",
+    },
+    # Seconds an unchanged response stays cached; changes bump its version
+    "responses": {
+        **RESPONSE_CACHE_BACKENDS[RESPONSE_CACHE_BACKEND],
+        "TIMEOUT": 60 * 60,
+    },
+}
+
+# Seconds a certificate_by_uuid response stays cached. Changes invalidate it,
+# but only in processes sharing the cache, so per-process locmem entries
+# are kept short.
+CERTIFICATE_LOOKUP_CACHE_TIMEOUT = (
+    60 if RESPONSE_CACHE_BACKEND == "locmem" else 60 * 60
+)
+
+# Seconds an authenticated user (with study center) stays cached
+AUTH_USER_CACHE_TIMEOUT = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -144,8 +220,9 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework.authentication.SessionAuthentication",
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "app.authentication.CachedJWTAuthentication",
     ),
+    "DEFAULT_PAGINATION_CLASS": "app.pagination.IdCursorPagination",
 }
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -185,3 +262,70 @@ SIMPLE_JWT = {
 }
 
 AUTH_USER_MODEL = "app.CustomUser"
+
+FRONTEND_URL = "https://study-app.ucrm.uz"
+
+# Processes used to render certificates; 1 renders serially in-process.
+# Larger values start one long-lived pool per web or run_render_jobs process.
+CERTIFICATE_RENDER_WORKERS = int(os.environ.get("CERTIFICATE_RENDER_WORKERS", 1))
+
+# Decoded course backgrounds kept per render process, in bytes of pixel
+# data (width * height * bands). An RGB A4 background at 300 DPI is about
+# 26 MB, so the default holds four or five; every pool worker has its own.
+CERTIFICATE_TEMPLATE_CACHE_BYTES = 128 * 1024 * 1024
+
+# Parsed (font file, size) pairs kept per render process
+CERTIFICATE_FONT_CACHE_SIZE = 32
+
+# Rendered QR codes memoized per (url, size) in each render process
+CERTIFICATE_QRCODE_CACHE_SIZE = 512
+
+# Directory of the content-addressed disk cache of rendered certificates,
+# e.g. BASE_DIR / "cache" / "certificates". Off unless set; an empty value
+# disables it.
+CERTIFICATE_RENDER_CACHE_DIR = os.environ.get("CERTIFICATE_RENDER_CACHE_DIR", "")
+CERTIFICATE_RENDER_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Rendered images kept per web process for the public image endpoint while
+# the disk cache is off; an A4 PNG is a few MB
+CERTIFICATE_IMAGE_CACHE_SIZE = 32
+
+# Longest side (px) of stored course backgrounds; A4 at 300 DPI
+COURSE_IMAGE_MAX_SIZE = 3508
+
+# Bounding box (px) of course thumbnails
+COURSE_THUMBNAIL_SIZE = 480
+
+# Rows inserted per bulk_create when importing certificates
+CERTIFICATE_IMPORT_BATCH_SIZE = 500
+
+# Seconds browsers may reuse a certificate image before revalidating
+CERTIFICATE_IMAGE_MAX_AGE = 300
+
+# Seconds the run_render_jobs worker sleeps when the queue is empty
+RENDER_JOB_POLL_INTERVAL = 2
+
+# Seconds without progress after which a running job is assumed to belong to
+# a dead worker and is claimed again
+RENDER_JOB_STALE_TIMEOUT = 10 * 60
+
+# Server-Timing headers and per-request timing logs (app.performance logger)
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED") == "1"
+
+# Requests slower than this (ms) log the SQL they ran
+SERVER_TIMING_SLOW_REQUEST_MS = 1000
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "app.performance": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}